@@ -0,0 +1,162 @@
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import decode_log
+import gen_log
+
+
+def Measure(_func, _size, _repeat):
+    """Best of _repeat runs of _func(), as MB/s over _size bytes."""
+    best = None
+    for i in range(_repeat):
+        start = time.perf_counter()
+        _func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best: best = elapsed
+    return _size / (1024.0 * 1024.0) / max(best, 1e-9)
+
+
+def DecodeAll(_buffer):
+    decode_log.lastseq = 0
+    decode_log.tea_keys.clear()
+    outbuffer = bytearray()
+    startpos = decode_log.GetLogStartPos(_buffer, 2)
+    while -1 != startpos:
+        startpos = decode_log.DecodeBuffer(_buffer, startpos, outbuffer)
+    return outbuffer
+
+
+def Payloads(_buffer):
+    """(magic, payload) of every good block, found by walking the headers."""
+    payloads = []
+    offset = decode_log.GetLogStartPos(_buffer, 1)
+    while -1 != offset and offset < len(_buffer):
+        if not decode_log.IsGoodLogBuffer(_buffer, offset, 1)[0]:
+            offset = decode_log.GetLogStartPos(_buffer, 1, offset + 1)
+            continue
+        magic, seq, begin_hour, end_hour, length = decode_log.HEADER.unpack_from(_buffer, offset)
+        start = offset + decode_log.HEADER.size + decode_log.BLOCK_TYPES[magic].crypt_key_len
+        payloads.append((magic, bytes(_buffer[start:start + length])))
+        offset = start + length + 1
+    return payloads
+
+
+def BenchFile(_results, _name, _path, _repeat):
+    _buffer = decode_log.ReadFile(_path)
+    size = len(_buffer)
+    # DecodeBuffer prints a traceback for every block that fails to decompress
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stderr(devnull):
+        _results['decode.%s' % _name] = Measure(lambda: DecodeAll(_buffer), size, _repeat)
+    _results['verify.%s' % _name] = Measure(lambda: decode_log.VerifyBuffer(_buffer), size, _repeat)
+
+
+def BenchStages(_results, _magic, _path, _repeat):
+    """tea / decompress on the payloads of a clean single-magic file."""
+    payloads = Payloads(decode_log.ReadFile(_path))
+    size = sum(len(payload) for magic, payload in payloads)
+    blocktype = decode_log.BLOCK_TYPES[_magic]
+    if 'tea' == blocktype.crypt:
+        tea_key = gen_log.GetTestTeaKey()
+        _results['tea.0x%02X' % _magic] = Measure(
+            lambda: [decode_log.tea_decrypt(payload, tea_key) for magic, payload in payloads], size, _repeat)
+        payloads = [(magic, decode_log.tea_decrypt(payload, tea_key)) for magic, payload in payloads]
+    if blocktype.compress is not None:
+        decompress = decode_log.DECOMPRESSORS[blocktype.compress]
+        _results['decompress.0x%02X' % _magic] = Measure(
+            lambda: [decompress(payload) for magic, payload in payloads], size, _repeat)
+
+
+def RunBenchmarks(_size=4 * 1024 * 1024, _repeat=3, _seed=1, _magics=None, _workdir=None):
+    """
+    Generate corpora with gen_log (mixed and one per magic, clean and with
+    corrupted blocks) in _workdir, reusing files already there, and return
+    {benchmark name: MB/s}:
+
+        decode.<corpus>   end-to-end DecodeBuffer loop
+        verify.<corpus>   header walk of VerifyBuffer
+        tea.<magic>       tea_decrypt on block payloads
+        decompress.<magic> zlib / zstd on (decrypted) block payloads
+        resync.garbage    GetLogStartPos over random bytes
+    """
+    if _workdir is None:
+        with tempfile.TemporaryDirectory(prefix="bench_log.") as workdir:
+            return RunBenchmarks(_size, _repeat, _seed, _magics, workdir)
+
+    magics = _magics or gen_log.MAGICS
+    decode_log.PRIV_KEY = gen_log.TEST_PRIV_KEY
+    results = {}
+
+    corpora = [('mixed.clean', magics, 0.0), ('mixed.corrupt', magics, 0.02)]
+    corpora += [('0x%02X.clean' % magic, [magic], 0.0) for magic in magics]
+    corpora += [('0x%02X.corrupt' % magic, [magic], 0.02) for magic in magics]
+    for name, corpus_magics, corrupt_rate in corpora:
+        path = os.path.join(_workdir, name + ".xlog")
+        if not os.path.exists(path):
+            gen_log.GenerateFile(path, _size if name.startswith('mixed') else max(_size // 4, 64 * 1024),
+                                 magics=corpus_magics, seed=_seed, gap_rate=corrupt_rate,
+                                 corrupt_rate=corrupt_rate)
+        BenchFile(results, name, path, _repeat)
+        if 1 == len(corpus_magics) and 0.0 == corrupt_rate:
+            BenchStages(results, corpus_magics[0], path, _repeat)
+
+    garbage = bytes(random.Random(_seed).getrandbits(8) for _ in range(min(_size, 1024 * 1024)))
+    results['resync.garbage'] = Measure(lambda: decode_log.GetLogStartPos(garbage, 1), len(garbage), _repeat)
+    return results
+
+
+def CompareBaseline(_results, _baseline, _threshold):
+    """Names of benchmarks more than _threshold (0.1 = 10%) slower than _baseline."""
+    regressions = []
+    for name, speed in sorted(_results.items()):
+        if name in _baseline and speed < _baseline[name] * (1.0 - _threshold):
+            regressions.append({'name': name, 'baseline': _baseline[name], 'result': speed})
+    return regressions
+
+
+def main(args):
+    size = 4 * 1024 * 1024
+    repeat = 3
+    magics = None
+    baseline = None
+    save = None
+    workdir = None
+    threshold = 0.1
+    for arg in args:
+        name, _, value = arg.partition('=')
+        if '--size' == name:
+            size = gen_log.ParseSize(value)
+        elif '--repeat' == name:
+            repeat = int(value)
+        elif '--magics' == name:
+            magics = [int(magic, 16) for magic in value.split(',')]
+        elif '--baseline' == name:
+            baseline = value
+        elif '--save' == name:
+            save = value
+        elif '--threshold' == name:
+            threshold = float(value)
+        elif '--workdir' == name:
+            workdir = value
+        else:
+            sys.stderr.write("usage: bench_log.py [--size=4M] [--repeat=N] [--magics=03,07,...] [--workdir=DIR] "
+                             "[--save=results.json] [--baseline=results.json] [--threshold=0.1]\n")
+            return 1
+
+    results = RunBenchmarks(size, repeat, 1, magics, workdir)
+    report = {'unit': 'MB/s', 'size': size, 'results': results}
+    if baseline is not None:
+        report['regressions'] = CompareBaseline(results, json.load(open(baseline))['results'], threshold)
+    sys.stdout.write(json.dumps(report, sort_keys=True, indent=2) + "\n")
+    if save is not None:
+        with open(save, "w") as fp:
+            json.dump(report, fp, sort_keys=True, indent=2)
+    return 1 if report.get('regressions') else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
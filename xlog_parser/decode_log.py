@@ -1,13 +1,24 @@
+import array
+import base64
 import binascii
+import calendar
+import collections
 import glob
+import hashlib
+import heapq
+import json
+import math
+import mmap
 import os
+import random
+import re
 import struct
 import sys
 import traceback
 import zlib
 
-import pyelliptic
-import zstandard as zstd
+# pyelliptic, zstandard and sqlite3 are imported where they are first needed:
+# a file with only plain or deflate blocks never pays for loading them
 
 MAGIC_NO_COMPRESS_START = 0x03
 MAGIC_NO_COMPRESS_START1 = 0x06
@@ -24,7 +35,26 @@ MAGIC_ASYNC_NO_CRYPT_ZSTD_START = 0x0D
 
 MAGIC_END = 0x00
 
+# magic, seq, begin hour, end hour, length; the crypt key (BlockType.crypt_key_len bytes) follows
+HEADER = struct.Struct("=BHBBI")
+
 lastseq = 0
+tea_keys = {}
+
+# [level][time][pid, tid(*)][tag][file, func, line][message
+LOG_LINE_RE = re.compile(br"^\[([VDIWEF])\]\[([^\]]*)\]\[(\d+), (\d+)\*?\]\[([^\]]*)\]")
+LOG_LINE_FIELDS = {'level': 1, 'time': 2, 'pid': 3, 'tid': 4, 'tag': 5}
+LOG_RECORD_RE = re.compile(br"^\[([VDIWEF])\]\[([^\]]*)\]\[(\d+), (\d+)\*?\]\[([^\]]*)\](?:\[[^\]]*\]\[)?(.*)$", re.S)
+LOG_TIME_RE = re.compile(br"^(\d+)-(\d+)-(\d+) ([+-]?[\d.]+) (\d+):(\d+):(\d+)(?:\.(\d+))?$")
+LOG_TOKEN_RE = re.compile(br"\w+")
+# numbers, 0x... and hex ids starting with a digit, masked to get the template of a message
+LOG_TEMPLATE_RE = re.compile(br"\d[0-9a-fA-Fx]*")
+
+# <xlog>.bloom sidecar: header, then one entry + filter bytes per block
+BLOOM_MAGIC = b"XLBF"
+BLOOM_HEADER = struct.Struct("=4sBQq")  # magic, version, size and mtime (ns) of the xlog file
+BLOOM_VERSION = 2
+BLOOM_ENTRY = struct.Struct("=QIB")  # block offset, filter length in bytes, hash count
 
 PRIV_KEY = "MyPrivateKey"
 PUB_KEY = "MyPublicKey"
@@ -38,6 +68,515 @@ class ZstdDecompressReader:
         return self.buffer
 
 
+class LogSplitter:
+    """
+    Route decoded lines to one output file per value of the chosen line
+    fields (level, tag, pid, tid), e.g. xxx.log -> xxx.MicroMsg.Foo.log.
+    Lines that carry no header (continuations, [F] messages) follow the
+    previous line. Output is buffered per shard, all buffers are written
+    out once they hold max_buffered bytes together, and at most max_open
+    files are kept open at once.
+    """
+
+    def __init__(self, outfile, fields, max_open=64, bufsize=256 * 1024, max_buffered=16 * 1024 * 1024):
+        self.root, self.ext = os.path.splitext(outfile)
+        self.groups = [LOG_LINE_FIELDS[f] for f in fields]
+        self.max_open = max_open
+        self.bufsize = bufsize
+        self.max_buffered = max_buffered
+        self.buffered = 0
+        self.key = '_'
+        self.rest = b''
+        self.buffers = {}
+        self.files = collections.OrderedDict()
+        self.created = set()  # normcased paths written in this run
+
+    def block(self, offset, seq):
+        pass
+
+    def write(self, data):
+        lines = (self.rest + bytes(data)).split(b"\n")
+        self.rest = lines.pop()
+        match = LOG_LINE_RE.match
+        for line in lines:
+            m = match(line)
+            if m is not None:
+                self.key = b'_'.join(m.group(g) for g in self.groups).decode('utf-8', 'replace')
+            buf = self.buffers.get(self.key)
+            if buf is None:
+                buf = self.buffers[self.key] = bytearray()
+            buf += line
+            buf += b"\n"
+            self.buffered += len(line) + 1
+            if len(buf) >= self.bufsize:
+                self.flush(self.key)
+            elif self.buffered >= self.max_buffered:
+                for key in list(self.buffers):
+                    self.flush(key)
+
+    def flush(self, key):
+        path = '%s.%s%s' % (self.root, ShardName(key), self.ext)
+        fp = self.files.pop(path, None)
+        if fp is None:
+            if len(self.files) >= self.max_open:
+                self.files.popitem(last=False)[1].close()
+            # keys can still meet on a case-insensitive file system
+            fp = open(path, "ab" if os.path.normcase(path) in self.created else "wb")
+            self.created.add(os.path.normcase(path))
+        self.files[path] = fp
+        buf = self.buffers.pop(key)
+        fp.write(buf)
+        self.buffered -= len(buf)
+
+    def close(self):
+        if self.rest:
+            self.write(b"\n")
+        for key in list(self.buffers):
+            self.flush(key)
+        for fp in self.files.values():
+            fp.close()
+        self.files.clear()
+
+
+def ShardName(_key):
+    """
+    File name part for a LogSplitter key, one-to-one: every character
+    but word characters, '.' and '-' (so % too) becomes %XX per UTF-8 byte.
+    """
+    return re.sub(r'[^\w.-]', lambda m: ''.join('%%%02X' % b for b in m.group().encode('utf-8')), _key)
+
+
+class LogExporter:
+    """
+    Parse decoded lines into (file, seq, timestamp, level, tag, pid, tid,
+    message) rows of the log table created by OpenLogDatabase. Rows are
+    inserted with executemany and committed every batch rows; the FTS5
+    index is filled for the whole file in one statement on close().
+    """
+
+    def __init__(self, conn, name, batch=100000):
+        self.conn = conn
+        self.name = name
+        self.batch = batch
+        self.seq = 0
+        self.rest = b''
+        self.rows = []
+        self.firstid = conn.execute("SELECT ifnull(max(id), 0) FROM log").fetchone()[0]
+
+    def block(self, offset, seq):
+        self.seq = seq
+
+    def write(self, data):
+        lines = (self.rest + bytes(data)).split(b"\n")
+        self.rest = lines.pop()
+        match = LOG_RECORD_RE.match
+        rows = self.rows
+        for line in lines:
+            m = match(line)
+            if m is None and rows and not line.startswith(b"[F]decode_log_file.py"):
+                # continuation of a multi-line message
+                rows[-1][7] += "\n" + line.decode('utf-8', 'replace')
+            elif m is None:
+                rows.append([self.name, self.seq, None, None, None, None, None, line.decode('utf-8', 'replace')])
+            else:
+                level, logtime, pid, tid, tag, message = m.groups()
+                rows.append([self.name, self.seq, ParseLogTime(logtime), level.decode(), tag.decode('utf-8', 'replace'),
+                             int(pid), int(tid), message.decode('utf-8', 'replace')])
+        # keep the last row open for continuation lines from the next block
+        if len(rows) > self.batch:
+            self.flush(rows[:-1])
+            del rows[:-1]
+
+    def flush(self, rows):
+        self.conn.executemany("INSERT INTO log (file, seq, timestamp, level, tag, pid, tid, message) "
+                              "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.conn.commit()
+
+    def close(self):
+        if self.rest:
+            self.write(b"\n")
+        self.flush(self.rows)
+        self.rows = []
+        self.conn.execute("INSERT INTO log_fts (rowid, message) SELECT id, message FROM log WHERE id > ?", (self.firstid,))
+        self.conn.commit()
+
+
+class LogIndexer:
+    """
+    Write the decoded output to outfile and, per block, a bloom filter of
+    the lowercased word tokens it produced to the sidecar file, so that
+    SearchFile only has to decrypt and decompress blocks that may match.
+    Both files are created with the first block, so a file without any
+    good block leaves neither behind.
+    """
+
+    def __init__(self, outfile, sidecar, stat, fp_rate=0.01):
+        self.outfile = outfile
+        self.sidecarfile = sidecar
+        self.stat = stat
+        self.fp = None
+        self.sidecar = None
+        self.fp_rate = fp_rate
+        self.offset = -1
+        self.tokens = set()
+
+    def block(self, offset, seq):
+        if self.fp is None:
+            self.fp = open(self.outfile, "wb")
+            self.sidecar = open(self.sidecarfile, "wb")
+            self.sidecar.write(BLOOM_HEADER.pack(BLOOM_MAGIC, BLOOM_VERSION, self.stat.st_size, self.stat.st_mtime_ns))
+        if offset != self.offset:
+            self.flush()
+            self.offset = offset
+
+    def write(self, data):
+        self.fp.write(data)
+        self.tokens.update(LOG_TOKEN_RE.findall(bytes(data).lower()))
+
+    def flush(self):
+        if -1 == self.offset: return
+        n = max(len(self.tokens), 1)
+        nbytes = max(int(-n * math.log(self.fp_rate) / (math.log(2) ** 2) / 8) + 1, 8)
+        k = max(int(round(nbytes * 8.0 / n * math.log(2))), 1)
+        bits = bytearray(nbytes)
+        for token in self.tokens:
+            for pos in BloomPositions(token, nbytes * 8, k):
+                bits[pos >> 3] |= 1 << (pos & 7)
+        self.sidecar.write(BLOOM_ENTRY.pack(self.offset, nbytes, k))
+        self.sidecar.write(bits)
+        self.tokens = set()
+
+    def close(self):
+        if self.fp is None: return
+        self.flush()
+        self.sidecar.close()
+        self.fp.close()
+
+
+def BloomPositions(_token, _nbits, _k):
+    h1 = zlib.crc32(_token) & 0xffffffff
+    h2 = zlib.adler32(_token) | 1
+    return [(h1 + i * h2) % _nbits for i in range(_k)]
+
+
+def LoadBloomIndex(_sidecar, _stat, _tokens):
+    """
+    Returns the offsets of the blocks whose filter may contain all of
+    _tokens, or None if there is no sidecar for this version of the file
+    (same size and mtime as _stat).
+    """
+    if not os.path.exists(_sidecar): return None
+    fp = open(_sidecar, "rb")
+    data = fp.read()
+    fp.close()
+
+    if len(data) < BLOOM_HEADER.size: return None
+    magic, version, size, mtime = BLOOM_HEADER.unpack_from(data, 0)
+    if BLOOM_MAGIC != magic or BLOOM_VERSION != version: return None
+    if size != _stat.st_size or mtime != _stat.st_mtime_ns: return None
+
+    offsets = []
+    pos = BLOOM_HEADER.size
+    while pos + BLOOM_ENTRY.size <= len(data):
+        offset, nbytes, k = BLOOM_ENTRY.unpack_from(data, pos)
+        pos += BLOOM_ENTRY.size
+        if all(data[pos + (i >> 3)] >> (i & 7) & 1 for token in _tokens for i in BloomPositions(token, nbytes * 8, k)):
+            offsets.append(offset)
+        pos += nbytes
+    return offsets
+
+
+def PackSketch(_data):
+    return base64.b64encode(zlib.compress(bytes(_data))).decode('ascii')
+
+
+def UnpackSketch(_text):
+    return zlib.decompress(base64.b64decode(_text))
+
+
+class CountMinSketch:
+    """
+    Approximate counts of byte-string keys in depth rows of width
+    counters; an estimate is never low and is high by at most about
+    e / width of the total with probability 1 - exp(-depth). Sketches of
+    the same shape merge by adding their counters.
+    """
+
+    def __init__(self, width=2048, depth=4, table=None):
+        self.width = width
+        self.depth = depth
+        self.table = array.array('Q', bytes(8 * width * depth) if table is None else table)
+
+    def add(self, key, count=1):
+        """Count key count more times and return its new estimate."""
+        table = self.table
+        estimate = None
+        for row, col in enumerate(BloomPositions(key, self.width, self.depth)):
+            pos = row * self.width + col
+            table[pos] += count
+            if estimate is None or table[pos] < estimate: estimate = table[pos]
+        return estimate
+
+    def estimate(self, key):
+        return min(self.table[row * self.width + col]
+                   for row, col in enumerate(BloomPositions(key, self.width, self.depth)))
+
+    def merge(self, other):
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("count-min sketches of different shapes")
+        self.table = array.array('Q', [a + b for a, b in zip(self.table, other.table)])
+
+    def dump(self):
+        return {'width': self.width, 'depth': self.depth, 'table': PackSketch(self.table.tobytes())}
+
+    @classmethod
+    def load(cls, state):
+        return cls(state['width'], state['depth'], UnpackSketch(state['table']))
+
+
+class HyperLogLog:
+    """
+    Approximate number of distinct byte strings in 2 ** precision one-byte
+    registers, with a standard error of about 1.04 / sqrt(2 ** precision)
+    (0.8% for the default). Merging takes the register-wise maximum.
+    """
+
+    def __init__(self, precision=14, registers=None):
+        self.hash = hashlib.blake2b
+        self.precision = precision
+        self.registers = bytearray(1 << precision) if registers is None else bytearray(registers)
+
+    def add(self, value):
+        h = int.from_bytes(self.hash(value, digest_size=8).digest(), 'little')
+        index = h & ((1 << self.precision) - 1)
+        rank = 64 - self.precision - (h >> self.precision).bit_length() + 1
+        if rank > self.registers[index]: self.registers[index] = rank
+
+    def count(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # linear counting is more accurate while many registers are still empty
+            estimate = m * math.log(float(m) / zeros)
+        return int(round(estimate))
+
+    def merge(self, other):
+        if self.precision != other.precision:
+            raise ValueError("HyperLogLogs of different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def dump(self):
+        return {'precision': self.precision, 'registers': PackSketch(self.registers)}
+
+    @classmethod
+    def load(cls, state):
+        return cls(state['precision'], UnpackSketch(state['registers']))
+
+
+class LineReservoir:
+    """
+    Uniform sample of size lines: every line draws a random key and the
+    size largest keys are kept, so two reservoirs merge into a uniform
+    sample of both streams by keeping the largest keys of the two. Lines
+    are kept as bytes and only decoded for the report.
+    """
+
+    def __init__(self, size=20, seed=None, items=None):
+        self.size = size
+        self.random = random.Random(seed)
+        self.items = [] if items is None else [(key, line.encode('utf-8', 'surrogateescape')) for key, line in items]
+        heapq.heapify(self.items)
+
+    def add(self, line):
+        key = self.random.random()
+        if len(self.items) < self.size:
+            heapq.heappush(self.items, (key, line))
+        elif key > self.items[0][0]:
+            heapq.heapreplace(self.items, (key, line))
+
+    def merge(self, other):
+        self.items = heapq.nlargest(self.size, self.items + other.items)
+        heapq.heapify(self.items)
+
+    def lines(self):
+        return [line.decode('utf-8', 'replace') for key, line in sorted(self.items, reverse=True)]
+
+    def dump(self):
+        return {'size': self.size, 'items': [[key, line.decode('utf-8', 'surrogateescape')] for key, line in self.items]}
+
+    @classmethod
+    def load(cls, state):
+        return cls(state['size'], items=state['items'])
+
+
+class LogSketcher:
+    """
+    Analytics writer for ParseFile: keeps level and tag frequencies in a
+    count-min sketch (with the top candidates of each), the number of
+    distinct message templates (digits and hex ids masked) in a
+    HyperLogLog and a reservoir sample of lines, and writes no plaintext.
+    Counts are gathered per block and added to the sketch in one go.
+    Sketchers merge, so per-file results can be combined per batch.
+    """
+
+    def __init__(self, name=None, top=32, samples=20, width=2048, depth=4, precision=14):
+        self.name = name
+        self.top = top
+        self.lines = 0
+        self.rest = b''
+        self.countmin = CountMinSketch(width, depth)
+        self.templates = HyperLogLog(precision)
+        self.reservoir = LineReservoir(samples, name)
+        self.candidates = {'level': {}, 'tag': {}}
+
+    def block(self, offset, seq):
+        pass
+
+    def write(self, data):
+        lines = (self.rest + bytes(data)).split(b"\n")
+        self.rest = lines.pop()
+        self.count(lines)
+
+    def count(self, lines):
+        match = LOG_RECORD_RE.match
+        mask = LOG_TEMPLATE_RE.sub
+        counts = collections.Counter()
+        templates = set()
+        for line in lines:
+            self.reservoir.add(line)
+            m = match(line)
+            if m is None: continue
+            counts['level', m.group(1)] += 1
+            counts['tag', m.group(5)] += 1
+            templates.add(mask(b"#", m.group(6)))
+
+        self.lines += len(lines)
+        for (field, key), count in counts.items():
+            self.note(field, key, self.countmin.add(field.encode() + b"\0" + key, count))
+        for template in templates:
+            self.templates.add(template)
+
+    def note(self, field, key, estimate):
+        candidates = self.candidates[field]
+        if key not in candidates and len(candidates) >= self.top:
+            smallest = min(candidates, key=candidates.get)
+            if estimate <= candidates[smallest]: return
+            del candidates[smallest]
+        candidates[key] = estimate
+
+    def merge(self, other):
+        self.lines += other.lines
+        self.countmin.merge(other.countmin)
+        self.templates.merge(other.templates)
+        self.reservoir.merge(other.reservoir)
+        for field, candidates in self.candidates.items():
+            keys = set(candidates) | set(other.candidates[field])
+            candidates.clear()
+            for key in keys:
+                self.note(field, key, self.countmin.estimate(field.encode() + b"\0" + key))
+
+    def close(self):
+        if self.rest:
+            self.count([self.rest])
+            self.rest = b''
+
+    def report(self, state=True):
+        """
+        JSON-ready summary; with state the sketches themselves are
+        included, so that LogSketcher.load() can merge reports later.
+        """
+        report = {'file': self.name, 'lines': self.lines, 'templates': self.templates.count(),
+                  'samples': self.reservoir.lines()}
+        for field, candidates in self.candidates.items():
+            ranked = sorted(candidates.items(), key=lambda item: (-item[1], item[0]))
+            report[field + 's'] = [[key.decode('utf-8', 'surrogateescape'), count] for key, count in ranked]
+        if state:
+            report['sketch'] = {'countmin': self.countmin.dump(), 'hll': self.templates.dump(),
+                                'reservoir': self.reservoir.dump()}
+        return report
+
+    @classmethod
+    def load(cls, report):
+        sketch = report['sketch']
+        sketcher = cls(report['file'], top=max(len(report['levels']), len(report['tags']), 1))
+        sketcher.lines = report['lines']
+        sketcher.countmin = CountMinSketch.load(sketch['countmin'])
+        sketcher.templates = HyperLogLog.load(sketch['hll'])
+        sketcher.reservoir = LineReservoir.load(sketch['reservoir'])
+        for field in sketcher.candidates:
+            sketcher.candidates[field] = dict((key.encode('utf-8', 'surrogateescape'), count)
+                                              for key, count in report[field + 's'])
+        return sketcher
+
+
+def SearchFile(_file, _keyword):
+    """
+    Return the decoded lines containing every word token of _keyword
+    (case-insensitive). Only blocks passing the bloom sidecar written by
+    --index are decoded; without a current sidecar every block is.
+    """
+    global lastseq
+
+    tokens = LOG_TOKEN_RE.findall(_keyword.lower())
+    if not tokens:
+        raise ValueError("no word to search for in %r" % _keyword)
+    patterns = [re.compile(br"(?<!\w)" + re.escape(token) + br"(?!\w)", re.I) for token in tokens]
+    stat = os.stat(_file)
+    _buffer = MapFile(_file)
+    if _buffer is None: return []
+
+    result = []
+    outbuffer = bytearray()
+    try:
+        offsets = LoadBloomIndex(_file + ".bloom", stat, tokens)
+        if offsets is None:
+            lastseq = 0
+            startpos = GetLogStartPos(_buffer, 2)
+            while -1 != startpos:
+                startpos = DecodeBuffer(_buffer, startpos, outbuffer)
+        else:
+            for offset in offsets:
+                lastseq = 0
+                DecodeBuffer(_buffer, offset, outbuffer)
+    finally:
+        _buffer.close()
+
+    for line in outbuffer.splitlines(True):
+        if all(pattern.search(line) for pattern in patterns):
+            result.append(bytes(line))
+    return result
+
+
+def ParseLogTime(_time):
+    """
+    '2019-04-22 +8.0 15:07:53.570' -> seconds since the epoch (UTC)
+    """
+    m = LOG_TIME_RE.match(_time)
+    if m is None: return None
+    year, month, day, tz, hour, minute, second, msec = m.groups()
+    t = calendar.timegm((int(year), int(month), int(day), int(hour), int(minute), int(second), 0, 0, 0))
+    return t - float(tz) * 3600 + (int(msec) / 1000.0 if msec else 0)
+
+
+def OpenLogDatabase(_path):
+    import sqlite3
+    conn = sqlite3.connect(_path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("CREATE TABLE IF NOT EXISTS log (id INTEGER PRIMARY KEY, file TEXT, seq INTEGER, timestamp REAL, "
+                 "level TEXT, tag TEXT, pid INTEGER, tid INTEGER, message TEXT)")
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS log_fts USING fts5(message, content='log', content_rowid='id')")
+    return conn
+
+
+def CloseLogDatabase(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS log_tag ON log (tag, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS log_file ON log (file, seq)")
+    conn.commit()
+    conn.close()
+
+
 def tea_decipher(v, k):
     op = 0xffffffff
     v0, v1 = struct.unpack('=LL', v[0:8])
@@ -53,32 +592,95 @@ def tea_decipher(v, k):
 
 def tea_decrypt(v, k):
     num = int(len(v) / 8) * 8
-    ret = b''
-    for i in range(0, num, 8):
-        x = tea_decipher(v[i:i + 8], k)
-        ret = ret + x
+    ret = [tea_decipher(v[i:i + 8], k) for i in range(0, num, 8)]
+    ret.append(bytes(v[num:]))
+    return b''.join(ret)
+
+
+def GetTeaKey(_pubkey):
+    """
+    ECDH between PRIV_KEY and the client public key (x + y) of a block
+    header. Every block written by one client process carries the same
+    key, so the result is cached instead of agreed again per block.
+    """
+    key = (PRIV_KEY, _pubkey)
+    tea_key = tea_keys.get(key)
+    if tea_key is None:
+        import pyelliptic
+        svr = pyelliptic.ECC(curve='secp256k1')
+        svr.privkey = binascii.unhexlify(PRIV_KEY)
+        tea_key = svr.raw_get_ecdh_key(_pubkey[:32], _pubkey[32:])
+        if len(tea_keys) >= 4096: tea_keys.clear()
+        tea_keys[key] = tea_key
+    return tea_key
+
 
-    ret = ret + v[num:]
-    return ret
+def Inflate(_data):
+    return zlib.decompressobj(-zlib.MAX_WBITS).decompress(bytes(_data))
+
+
+def InflateSegments(_data):
+    """Deflate output cut into u16-length-prefixed pieces (MAGIC_COMPRESS_START1)."""
+    data = bytearray()
+    pos = 0
+    while pos < len(_data):
+        single_log_len = struct.unpack_from("H", _data, pos)[0]
+        data.extend(_data[pos + 2:pos + single_log_len + 2])
+        pos += single_log_len + 2
+    return Inflate(data)
+
+
+def ZstdDecompress(_data):
+    import zstandard as zstd
+    return next(zstd.ZstdDecompressor().read_from(ZstdDecompressReader(bytes(_data)), 100000, 1000000))
+
+
+DECOMPRESSORS = {
+    None: bytes,
+    'deflate': Inflate,
+    'deflate_segments': InflateSegments,
+    'zstd': ZstdDecompress,
+}
+
+
+def DecodePayload(_blocktype, _payload, _crypt_key):
+    """Default BlockType handler: decrypt if the type is encrypted, then decompress."""
+    if 'tea' == _blocktype.crypt:
+        _payload = tea_decrypt(_payload, GetTeaKey(_crypt_key))
+    return DECOMPRESSORS[_blocktype.compress](_payload)
+
+
+# what a block of each magic looks like; handler(blocktype, payload, crypt key) returns the text
+BlockType = collections.namedtuple('BlockType', ['crypt_key_len', 'crypt', 'compress', 'handler'])
+
+# indexed by the first byte of a block, None for bytes that do not start one:
+# a new block type is one more entry here
+BLOCK_TYPES = [None] * 256
+BLOCK_TYPES[MAGIC_NO_COMPRESS_START] = BlockType(4, None, None, DecodePayload)
+BLOCK_TYPES[MAGIC_COMPRESS_START] = BlockType(4, None, 'deflate', DecodePayload)
+BLOCK_TYPES[MAGIC_COMPRESS_START1] = BlockType(4, None, 'deflate_segments', DecodePayload)
+BLOCK_TYPES[MAGIC_NO_COMPRESS_START1] = BlockType(64, None, None, DecodePayload)
+BLOCK_TYPES[MAGIC_NO_COMPRESS_NO_CRYPT_START] = BlockType(64, None, None, DecodePayload)
+BLOCK_TYPES[MAGIC_COMPRESS_START2] = BlockType(64, 'tea', 'deflate', DecodePayload)
+BLOCK_TYPES[MAGIC_COMPRESS_NO_CRYPT_START] = BlockType(64, None, 'deflate', DecodePayload)
+BLOCK_TYPES[MAGIC_SYNC_ZSTD_START] = BlockType(64, None, None, DecodePayload)
+BLOCK_TYPES[MAGIC_SYNC_NO_CRYPT_ZSTD_START] = BlockType(64, None, None, DecodePayload)
+BLOCK_TYPES[MAGIC_ASYNC_ZSTD_START] = BlockType(64, 'tea', 'zstd', DecodePayload)
+BLOCK_TYPES[MAGIC_ASYNC_NO_CRYPT_ZSTD_START] = BlockType(64, None, 'zstd', DecodePayload)
 
 
 def IsGoodLogBuffer(_buffer, _offset, count):
     if _offset == len(_buffer): return (True, '')
 
-    magic_start = _buffer[_offset]
-    if MAGIC_NO_COMPRESS_START == magic_start or MAGIC_COMPRESS_START == magic_start or MAGIC_COMPRESS_START1 == magic_start:
-        crypt_key_len = 4
-    elif MAGIC_COMPRESS_START2 == magic_start or MAGIC_NO_COMPRESS_START1 == magic_start or MAGIC_NO_COMPRESS_NO_CRYPT_START == magic_start or MAGIC_COMPRESS_NO_CRYPT_START == magic_start \
-            or MAGIC_SYNC_ZSTD_START == magic_start or MAGIC_SYNC_NO_CRYPT_ZSTD_START == magic_start or MAGIC_ASYNC_ZSTD_START == magic_start or MAGIC_ASYNC_NO_CRYPT_ZSTD_START == magic_start:
-        crypt_key_len = 64
-    else:
+    blocktype = BLOCK_TYPES[_buffer[_offset]]
+    if blocktype is None:
         return (False, '_buffer[%d]:%d != MAGIC_NUM_START' % (_offset, _buffer[_offset]))
 
-    headerLen = 1 + 2 + 1 + 1 + 4 + crypt_key_len
+    headerLen = HEADER.size + blocktype.crypt_key_len
 
     if _offset + headerLen + 1 + 1 > len(_buffer): return (
         False, 'offset:%d > len(buffer):%d' % (_offset, len(_buffer)))
-    length = struct.unpack_from("I", buffer(_buffer, _offset + headerLen - 4 - crypt_key_len, 4))[0]
+    length = HEADER.unpack_from(_buffer, _offset)[4]
     if _offset + headerLen + length + 1 > len(_buffer): return (
         False, 'log length:%d, end pos %d > len(buffer):%d' % (length, _offset + headerLen + length + 1, len(_buffer)))
     if MAGIC_END != _buffer[_offset + headerLen + length]: return (False,
@@ -92,103 +694,82 @@ def IsGoodLogBuffer(_buffer, _offset, count):
         return IsGoodLogBuffer(_buffer, _offset + headerLen + length + 1, count - 1)
 
 
-def GetLogStartPos(_buffer, _count):
-    offset = 0
-    while True:
-        if offset >= len(_buffer): break
-
-        if MAGIC_NO_COMPRESS_START == _buffer[offset] or MAGIC_NO_COMPRESS_START1 == _buffer[
-            offset] or MAGIC_COMPRESS_START == _buffer[offset] or MAGIC_COMPRESS_START1 == _buffer[
-            offset] or MAGIC_COMPRESS_START2 == _buffer[offset] or MAGIC_COMPRESS_NO_CRYPT_START == _buffer[
-            offset] or MAGIC_NO_COMPRESS_NO_CRYPT_START == _buffer[offset] \
-                or MAGIC_SYNC_ZSTD_START == _buffer[offset] or MAGIC_SYNC_NO_CRYPT_ZSTD_START == _buffer[
-            offset] or MAGIC_ASYNC_ZSTD_START == _buffer[offset] or MAGIC_ASYNC_NO_CRYPT_ZSTD_START == _buffer[offset]:
-            if IsGoodLogBuffer(_buffer, offset, _count)[0]: return offset
+def GetLogStartPos(_buffer, _count, _offset=0):
+    offset = _offset
+    while offset < len(_buffer):
+        if BLOCK_TYPES[_buffer[offset]] is not None and IsGoodLogBuffer(_buffer, offset, _count)[0]: return offset
         offset += 1
 
     return -1
 
 
-def DecodeBuffer(_buffer, _offset, _outbuffer):
+def GetLogStartPosReverse(_buffer, _end):
+    """
+    Scan backwards from _end for the nearest block that passes
+    IsGoodLogBuffer and ends at or before _end, without touching the
+    bytes in front of it.
+    """
+    offset = _end - 1
+    while offset >= 0:
+        blocktype = BLOCK_TYPES[_buffer[offset]]
+        if blocktype is None:
+            offset -= 1
+            continue
+
+        headerLen = HEADER.size + blocktype.crypt_key_len
+        if offset + headerLen + 1 <= _end and IsGoodLogBuffer(_buffer, offset, 1)[0]:
+            length = HEADER.unpack_from(_buffer, offset)[4]
+            if offset + headerLen + length + 1 <= _end: return offset
+        offset -= 1
+
+    return -1
+
+
+def DecodeBuffer(_buffer, _offset, _outbuffer, _blockinfo=None, _seqstate=None):
+    """
+    Decode the block at (or, after a resync, following) _offset into
+    _outbuffer and return the offset of the next block, -1 at the end.
+    Missing seqs are checked against the module-wide lastseq unless a
+    one-element list _seqstate is given to hold it instead.
+    """
     if _offset >= len(_buffer): return -1
     ret = IsGoodLogBuffer(_buffer, _offset, 1)
     if not ret[0]:
-        fixpos = GetLogStartPos(_buffer[_offset:], 1)
+        fixpos = GetLogStartPos(_buffer, 1, _offset)
         if -1 == fixpos:
             return -1
         else:
-            _outbuffer.extend("[F]decode_log_file.py decode error len=%d, result:%s \n" % (fixpos, ret[1]))
-            _offset += fixpos
-
-    magic_start = _buffer[_offset]
-    if MAGIC_NO_COMPRESS_START == magic_start or MAGIC_COMPRESS_START == magic_start or MAGIC_COMPRESS_START1 == magic_start:
-        crypt_key_len = 4
-    elif MAGIC_COMPRESS_START2 == magic_start or MAGIC_NO_COMPRESS_START1 == magic_start or MAGIC_NO_COMPRESS_NO_CRYPT_START == magic_start or MAGIC_COMPRESS_NO_CRYPT_START == magic_start \
-            or MAGIC_SYNC_ZSTD_START == magic_start or MAGIC_SYNC_NO_CRYPT_ZSTD_START == magic_start or MAGIC_ASYNC_ZSTD_START == magic_start or MAGIC_ASYNC_NO_CRYPT_ZSTD_START == magic_start:
-        crypt_key_len = 64
-    else:
-        _outbuffer.extend('in DecodeBuffer _buffer[%d]:%d != MAGIC_NUM_START' % (_offset, magic_start))
-        return -1
+            _outbuffer.extend(("[F]decode_log_file.py decode error len=%d, result:%s \n" % (fixpos - _offset, ret[1])).encode())
+            _offset = fixpos
 
-    headerLen = 1 + 2 + 1 + 1 + 4 + crypt_key_len
-    length = struct.unpack_from("I", buffer(_buffer, _offset + headerLen - 4 - crypt_key_len, 4))[0]
-    tmpbuffer = bytearray(length)
+    blocktype = BLOCK_TYPES[_buffer[_offset]]
+    if blocktype is None:
+        _outbuffer.extend(('in DecodeBuffer _buffer[%d]:%d != MAGIC_NUM_START' % (_offset, _buffer[_offset])).encode())
+        return -1
 
-    seq = struct.unpack_from("H", buffer(_buffer, _offset + headerLen - 4 - crypt_key_len - 2 - 2, 2))[0]
-    begin_hour = struct.unpack_from("c", buffer(_buffer, _offset + headerLen - 4 - crypt_key_len - 1 - 1, 1))[0]
-    end_hour = struct.unpack_from("c", buffer(_buffer, _offset + headerLen - 4 - crypt_key_len - 1, 1))[0]
+    headerLen = HEADER.size + blocktype.crypt_key_len
+    magic_start, seq, begin_hour, end_hour, length = HEADER.unpack_from(_buffer, _offset)
 
     global lastseq
-    if seq != 0 and seq != 1 and lastseq != 0 and seq != (lastseq + 1):
-        _outbuffer.extend("[F]decode_log_file.py log seq:%d-%d is missing\n" % (lastseq + 1, seq - 1))
+    prevseq = lastseq if _seqstate is None else _seqstate[0]
+    if seq != 0 and seq != 1 and prevseq != 0 and seq != (prevseq + 1):
+        _outbuffer.extend(("[F]decode_log_file.py log seq:%d-%d is missing\n" % (prevseq + 1, seq - 1)).encode())
 
     if seq != 0:
-        lastseq = seq
+        if _seqstate is None:
+            lastseq = seq
+        else:
+            _seqstate[0] = seq
 
-    tmpbuffer[:] = _buffer[_offset + headerLen:_offset + headerLen + length]
+    if _blockinfo is not None:
+        _blockinfo[:] = [_offset, seq]
 
     try:
-
-        if MAGIC_NO_COMPRESS_START1 == _buffer[_offset] or MAGIC_SYNC_ZSTD_START == _buffer[_offset]:
-            pass
-
-        elif MAGIC_COMPRESS_START2 == _buffer[_offset] or MAGIC_ASYNC_ZSTD_START == _buffer[_offset]:
-            svr = pyelliptic.ECC(curve='secp256k1')
-            client = pyelliptic.ECC(curve='secp256k1')
-            client.pubkey_x = buffer(_buffer, _offset + headerLen - crypt_key_len, int(crypt_key_len / 2))
-            client.pubkey_y = buffer(_buffer, int(_offset + headerLen - crypt_key_len / 2), int(crypt_key_len / 2))
-
-            svr.privkey = binascii.unhexlify(PRIV_KEY)
-            tea_key = svr.get_ecdh_key(client.get_pubkey())
-
-            tmpbuffer = tea_decrypt(tmpbuffer, tea_key)
-            if MAGIC_COMPRESS_START2 == _buffer[_offset]:
-                decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
-                tmpbuffer = decompressor.decompress(bytes(tmpbuffer))
-            else:
-                decompressor = zstd.ZstdDecompressor()
-                tmpbuffer = next(decompressor.read_from(ZstdDecompressReader(tmpbuffer), 100000, 1000000))
-        elif MAGIC_ASYNC_NO_CRYPT_ZSTD_START == _buffer[_offset]:
-            decompressor = zstd.ZstdDecompressor()
-            tmpbuffer = next(decompressor.read_from(ZstdDecompressReader(bytes(tmpbuffer)), 100000, 1000000))
-        elif MAGIC_COMPRESS_START == _buffer[_offset] or MAGIC_COMPRESS_NO_CRYPT_START == _buffer[_offset]:
-            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
-            tmpbuffer = decompressor.decompress(bytes(tmpbuffer))
-        elif MAGIC_COMPRESS_START1 == _buffer[_offset]:
-            decompress_data = bytearray()
-            while len(tmpbuffer) > 0:
-                single_log_len = struct.unpack_from("H", buffer(tmpbuffer, 0, 2))[0]
-                decompress_data.extend(tmpbuffer[2:single_log_len + 2])
-                tmpbuffer[:] = tmpbuffer[single_log_len + 2:len(tmpbuffer)]
-
-            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
-            tmpbuffer = decompressor.decompress(bytes(decompress_data))
-
-        else:
-            pass
+        tmpbuffer = blocktype.handler(blocktype, bytes(_buffer[_offset + headerLen:_offset + headerLen + length]),
+                                      bytes(_buffer[_offset + HEADER.size:_offset + headerLen]))
     except Exception as e:
         traceback.print_exc()
-        _outbuffer.extend("[F]decode_log_file.py decompress err, " + "\n")
+        _outbuffer.extend(b"[F]decode_log_file.py decompress err, \n")
         return _offset + headerLen + length + 1
 
     _outbuffer.extend(tmpbuffer)
@@ -196,22 +777,89 @@ def DecodeBuffer(_buffer, _offset, _outbuffer):
     return _offset + headerLen + length + 1
 
 
-def buffer(_buffer, _offset, _size):
-    mv = memoryview(_buffer[_offset: _offset + _size])
-    return mv.tobytes()
-
-
-def ParseFile(_file, _outfile):
+def ReadFile(_file):
     fp = open(_file, "rb")
     _buffer = bytearray(os.path.getsize(_file))
     fp.readinto(_buffer)
     fp.close()
+    return _buffer
+
+
+def VerifyBuffer(_buffer):
+    """
+    Walk the block headers only (no ECDH, decryption or decompression) and
+    report what DecodeBuffer would flag inline: seq gaps, corrupted ranges
+    and the distance of every resync, plus block counts per magic.
+    """
+    report = {'size': len(_buffer), 'blocks': 0, 'magic': {}, 'seq_gaps': [], 'corrupted': [], 'resyncs': []}
+
+    offset = GetLogStartPos(_buffer, 2)
+    if -1 == offset:
+        if len(_buffer) > 0:
+            report['corrupted'].append({'offset': 0, 'length': len(_buffer), 'reason': 'no log start found'})
+        return report
+    if offset > 0:
+        report['corrupted'].append({'offset': 0, 'length': offset, 'reason': 'garbage before log start'})
+
+    _lastseq = 0
+    while offset < len(_buffer):
+        ret = IsGoodLogBuffer(_buffer, offset, 1)
+        if not ret[0]:
+            fixpos = GetLogStartPos(_buffer, 1, offset)
+            end = len(_buffer) if -1 == fixpos else fixpos
+            report['corrupted'].append({'offset': offset, 'length': end - offset, 'reason': ret[1]})
+            if -1 == fixpos: break
+            report['resyncs'].append(fixpos - offset)
+            offset = fixpos
+
+        magic_start, seq, begin_hour, end_hour, length = HEADER.unpack_from(_buffer, offset)
+        headerLen = HEADER.size + BLOCK_TYPES[magic_start].crypt_key_len
+
+        if seq != 0 and seq != 1 and _lastseq != 0 and seq != (_lastseq + 1):
+            report['seq_gaps'].append({'offset': offset, 'from': _lastseq + 1, 'to': seq - 1})
+        if seq != 0:
+            _lastseq = seq
+
+        key = '0x%02X' % magic_start
+        report['magic'][key] = report['magic'].get(key, 0) + 1
+        report['blocks'] += 1
+        offset += headerLen + length + 1
+
+    return report
+
+
+def VerifyFile(_file):
+    report = VerifyBuffer(ReadFile(_file))
+    report['file'] = _file
+    return report
+
+
+def ParseFile(_file, _outfile, _writer=None):
+    """
+    Decode _file into _outfile, or hand the output to _writer block by
+    block when one is given (anything with write() and close()).
+    """
+    _buffer = ReadFile(_file)
     startpos = GetLogStartPos(_buffer, 2)
+    outbuffer = bytearray()
+
+    if _writer is not None:
+        written = 0
+        blockinfo = [startpos, 0]
+        try:
+            while -1 != startpos:
+                startpos = DecodeBuffer(_buffer, startpos, outbuffer, blockinfo)
+                _writer.block(blockinfo[0], blockinfo[1])
+                written += len(outbuffer)
+                _writer.write(outbuffer)
+                del outbuffer[:]
+        finally:
+            _writer.close()
+        return 0 < written
+
     if -1 == startpos:
         return False
 
-    outbuffer = bytearray()
-
     while True:
         startpos = DecodeBuffer(_buffer, startpos, outbuffer)
         if -1 == startpos: break;
@@ -224,24 +872,172 @@ def ParseFile(_file, _outfile):
     return True
 
 
+def MapFile(_file):
+    if 0 == os.path.getsize(_file): return None
+    fp = open(_file, "rb")
+    _buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    fp.close()
+    return _buffer
+
+
+def HeadBuffer(_buffer, _lines):
+    """
+    Decode blocks from the start of the file until _lines lines are out.
+    """
+    global lastseq
+    lastseq = 0
+
+    outbuffer = bytearray()
+    count = 0
+    startpos = GetLogStartPos(_buffer, 2)
+    while -1 != startpos and count < _lines:
+        end = len(outbuffer)
+        startpos = DecodeBuffer(_buffer, startpos, outbuffer)
+        count += outbuffer.count(b"\n", end)
+
+    return b"".join(outbuffer.splitlines(True)[:_lines])
+
+
+def TailBuffer(_buffer, _lines):
+    """
+    Find block boundaries from the end of the file backwards and decode
+    only as many trailing blocks as needed for the last _lines lines.
+    """
+    global lastseq
+
+    pieces = []
+    count = 0
+    offset = GetLogStartPosReverse(_buffer, len(_buffer))
+    while -1 != offset and count < _lines:
+        prevpos = GetLogStartPosReverse(_buffer, offset)
+        # seed lastseq with the previous block so seq gaps are still reported
+        lastseq = 0 if -1 == prevpos else HEADER.unpack_from(_buffer, prevpos)[1]
+        outbuffer = bytearray()
+        DecodeBuffer(_buffer, offset, outbuffer)
+        count += outbuffer.count(b"\n")
+        pieces.append(outbuffer)
+        offset = prevpos
+
+    pieces.reverse()
+    return b"".join(b"".join(pieces).splitlines(True)[-_lines:]) if _lines > 0 else b""
+
+
+def HeadTailFile(_file, _outfile, _lines, _tail):
+    _buffer = MapFile(_file)
+    if _buffer is None: return False
+
+    try:
+        if _tail:
+            outbuffer = TailBuffer(_buffer, _lines)
+        else:
+            outbuffer = HeadBuffer(_buffer, _lines)
+    finally:
+        _buffer.close()
+
+    if 0 == len(outbuffer): return False
+
+    if _outfile is None:
+        getattr(sys.stdout, "buffer", sys.stdout).write(outbuffer)
+    else:
+        fpout = open(_outfile, "wb")
+        fpout.write(outbuffer)
+        fpout.close()
+    return True
+
+
 def main(args):
     global lastseq
 
+    if 0 < len(args) and '--verify' == args[0]:
+        for filepath in GetInputList(args[1:]):
+            sys.stdout.write(json.dumps(VerifyFile(filepath), sort_keys=True) + "\n")
+        return
+
+    if 0 < len(args) and (args[0].startswith('--head=') or args[0].startswith('--tail=')):
+        if len(args) not in (2, 3) or not args[0][len('--head='):].isdigit():
+            sys.stderr.write("usage: decode_log.py --head=N|--tail=N xxx.xlog [xxx.log]\n")
+            return
+        lines = int(args[0][len('--head='):])
+        HeadTailFile(args[1], args[2] if 3 == len(args) else None, lines, args[0].startswith('--tail='))
+        return
+
+    if 0 < len(args) and args[0].startswith('--sqlite='):
+        conn = OpenLogDatabase(args[0][len('--sqlite='):])
+        for filepath in GetInputList(args[1:]):
+            lastseq = 0
+            ParseFile(filepath, None, LogExporter(conn, filepath))
+        CloseLogDatabase(conn)
+        return
+
+    if 0 < len(args) and '--index' == args[0]:
+        for filepath, outfile in GetFileList(args[1:]):
+            lastseq = 0
+            ParseFile(filepath, outfile, LogIndexer(outfile, filepath + ".bloom", os.stat(filepath)))
+        return
+
+    if 0 < len(args) and '--stats' == args[0]:
+        merged = LogSketcher()
+        files = 0
+        for filepath in GetInputList(args[1:]):
+            lastseq = 0
+            sketcher = LogSketcher(filepath)
+            ParseFile(filepath, None, sketcher)
+            sys.stdout.write(json.dumps(sketcher.report(False), sort_keys=True) + "\n")
+            merged.merge(sketcher)
+            files += 1
+        report = merged.report()
+        report['files'] = files
+        sys.stdout.write(json.dumps(report, sort_keys=True) + "\n")
+        return
+
+    if 0 < len(args) and args[0].startswith('--search='):
+        keyword = args[0][len('--search='):].encode()
+        if not LOG_TOKEN_RE.search(keyword):
+            sys.stderr.write("usage: decode_log.py --search=KEYWORD [xxx.xlog ...]\n")
+            return
+        filelist = GetInputList(args[1:])
+        out = getattr(sys.stdout, "buffer", sys.stdout)
+        for filepath in filelist:
+            for line in SearchFile(filepath, keyword):
+                if 1 < len(filelist):
+                    out.write(filepath.encode() + b":")
+                out.write(line)
+        return
+
+    fields = None
+    if 0 < len(args) and args[0].startswith('--split='):
+        fields = args[0][len('--split='):].split(',')
+        args = args[1:]
+
+    for filepath, outfile in GetFileList(args):
+        lastseq = 0
+        ParseFile(filepath, outfile, None if fields is None else LogSplitter(outfile, fields))
+
+
+def GetFileList(args):
     if 1 == len(args):
         if os.path.isdir(args[0]):
-            filelist = glob.glob(args[0] + "/*.xlog")
-            for filepath in filelist:
-                lastseq = 0
-                ParseFile(filepath, filepath + ".log")
+            return [(filepath, filepath + ".log") for filepath in glob.glob(args[0] + "/*.xlog")]
         else:
-            ParseFile(args[0], args[0] + ".log")
+            return [(args[0], args[0] + ".log")]
     elif 2 == len(args):
-        ParseFile(args[0], args[1])
+        return [(args[0], args[1])]
     else:
-        filelist = glob.glob("*.xlog")
-        for filepath in filelist:
-            lastseq = 0
-            ParseFile(filepath, filepath + ".log")
+        return [(filepath, filepath + ".log") for filepath in glob.glob("*.xlog")]
+
+
+def GetInputList(args):
+    """
+    For the modes that write no .log: every argument is an input file,
+    except that a single directory stands for the .xlog files in it and
+    no argument at all for the ones in the current directory.
+    """
+    if 0 == len(args):
+        return glob.glob("*.xlog")
+    elif 1 == len(args) and os.path.isdir(args[0]):
+        return glob.glob(args[0] + "/*.xlog")
+    else:
+        return list(args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,246 @@
+import contextlib
+import json
+import math
+import os
+import random
+import struct
+import sys
+import time
+
+import decode_log
+import gen_log
+import serve_log
+from bench_log import DecodeAll
+
+MAGICS = bytes(gen_log.MAGICS)
+
+
+def GoodStart(_random):
+    """Two good blocks, so that GetLogStartPos(_buffer, 2) starts decoding at 0 and every later problem is a resync."""
+    generator = gen_log.LogGenerator(lines=1, seed=_random.randrange(1 << 30))
+    return bytearray(b"".join(generator.block(decode_log.MAGIC_NO_COMPRESS_NO_CRYPT_START)[0] for _ in range(2)))
+
+
+def Filler(_random, _count):
+    """Random bytes that are neither a magic nor MAGIC_END, so no candidate block starts or ends in them."""
+    return bytes(_random.randrange(0x10, 0x100) for _ in range(_count))
+
+
+def DenseMagic(_random, _size):
+    """
+    Nothing but magic bytes: a candidate block start at every offset, each
+    reading a length past the end, so the one resync walks the whole input.
+    """
+    out = GoodStart(_random)
+    out += bytes(_random.choice(MAGICS) for _ in range(_size - len(out)))
+    return bytes(out)
+
+
+def PastEof(_random, _size):
+    """Headers claiming a length that runs past the end, each followed by a good block to resync to."""
+    generator = gen_log.LogGenerator(lines=1, seed=_random.randrange(1 << 30))
+    out = GoodStart(_random)
+    while len(out) < _size:
+        magic = _random.choice(MAGICS)
+        out += struct.pack("=B", magic) + Filler(_random, 4) + struct.pack("=I", 0xF0F0F0F0)
+        out += Filler(_random, serve_log.HeaderLength(magic) - 9)
+        out += generator.block(decode_log.MAGIC_NO_COMPRESS_NO_CRYPT_START)[0]
+    return bytes(out[:_size])
+
+
+def BadTrailer(_random, _size):
+    """Complete-looking blocks whose end marker is wrong, each forcing a resync to the good block after it."""
+    generator = gen_log.LogGenerator(lines=1, seed=_random.randrange(1 << 30))
+    out = GoodStart(_random)
+    while len(out) < _size:
+        magic = _random.choice(MAGICS)
+        body = Filler(_random, _random.randrange(0, 64))
+        out += struct.pack("=B", magic) + Filler(_random, 4) + struct.pack("=I", len(body))
+        out += Filler(_random, serve_log.HeaderLength(magic) - 9) + body + b"\xff"
+        out += generator.block(decode_log.MAGIC_NO_COMPRESS_NO_CRYPT_START)[0]
+    return bytes(out[:_size])
+
+
+def GarbageBetween(_random, _size):
+    """Small good blocks separated by short runs of random bytes."""
+    generator = gen_log.LogGenerator(lines=1, seed=_random.randrange(1 << 30))
+    out = GoodStart(_random)
+    while len(out) < _size:
+        out += bytes(_random.getrandbits(8) for _ in range(_random.randrange(1, 32)))
+        out += generator.block(decode_log.MAGIC_NO_COMPRESS_NO_CRYPT_START)[0]
+    return bytes(out[:_size])
+
+
+def TruncatedTrailers(_random, _size):
+    """Good blocks cut short at a random point, each followed by the next block."""
+    generator = gen_log.LogGenerator(lines=2, seed=_random.randrange(1 << 30))
+    out = GoodStart(_random)
+    while len(out) < _size:
+        block = generator.block(decode_log.MAGIC_NO_COMPRESS_START1)[0]
+        out += block[:_random.randrange(1, len(block))]
+    return bytes(out[:_size])
+
+
+def TinySegments(_random, _size):
+    """One MAGIC_COMPRESS_START1 block made of one-byte u16-length segments."""
+    body = b"\1\0\xff" * (_size // 3)
+    return struct.pack("=BHBBI", decode_log.MAGIC_COMPRESS_START1, 1, 0, 0, len(body)) + b"\0" * 4 + body + b"\0"
+
+
+def BigTeaBlock(_random, _size):
+    """One encrypted block of _size bytes: tea_decrypt must stay linear in the block length."""
+    generator = gen_log.LogGenerator(seed=_random.randrange(1 << 30))
+    body = bytes(_random.getrandbits(8) for _ in range(_size))
+    return generator.block(decode_log.MAGIC_COMPRESS_START2, body)[0]
+
+
+# pattern -> (generator, base size in bytes, at least one candidate block start checked per this many
+# bytes, or None for the single-block patterns), so a fit cannot pass by skipping most of the input
+PATTERNS = {
+    'dense_magic': (DenseMagic, 128 * 1024, 2),
+    'past_eof': (PastEof, 128 * 1024, 256),
+    'bad_trailer': (BadTrailer, 128 * 1024, 256),
+    'garbage_between': (GarbageBetween, 1024 * 1024, 512),
+    'truncated_trailers': (TruncatedTrailers, 1024 * 1024, 256),
+    'tiny_segments': (TinySegments, 256 * 1024, None),
+    'big_tea_block': (BigTeaBlock, 16 * 1024, None),
+}
+
+OPERATIONS = {
+    'decode': DecodeAll,
+    'verify': decode_log.VerifyBuffer,
+    'split': serve_log.SplitSegments,
+    'tail': lambda _buffer: decode_log.TailBuffer(_buffer, 1 << 30),
+}
+
+
+def Elapsed(_func, _buffer, _repeat):
+    best = None
+    for i in range(_repeat):
+        start = time.perf_counter()
+        _func(_buffer)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best: best = elapsed
+    return best
+
+
+def Candidates(_func, _buffer):
+    """Run _func(_buffer) once and count the IsGoodLogBuffer calls, i.e. the candidate block starts checked."""
+    check = decode_log.IsGoodLogBuffer
+    calls = [0]
+
+    def counting(*args):
+        calls[0] += 1
+        return check(*args)
+
+    decode_log.IsGoodLogBuffer = counting
+    try:
+        _func(_buffer)
+    finally:
+        decode_log.IsGoodLogBuffer = check
+    return calls[0]
+
+
+def CheckScaling(_seed=1, _scale=1.0, _factor=4, _repeat=3, _max_exponent=1.5, _patterns=None):
+    """
+    Time every operation on every pattern at a base size and at _factor
+    times that, and fit t ~ size ** exponent through the two points. Linear
+    code gives an exponent near 1 and quadratic code 2, like the
+    slice-and-rescan resync DecodeBuffer used to do on garbage_between.
+    The candidate block starts checked are counted too, and a pattern
+    that is meant to keep resyncing fails if too few of them were.
+    """
+    decode_log.PRIV_KEY = gen_log.TEST_PRIV_KEY
+    results = []
+    for name in _patterns or sorted(PATTERNS):
+        func, base, stride = PATTERNS[name]
+        sizes = [int(base * _scale), int(base * _scale) * _factor]
+        buffers = [func(random.Random(_seed), size) for size in sizes]
+        for op in sorted(OPERATIONS):
+            seconds = [Elapsed(OPERATIONS[op], _buffer, _repeat) for _buffer in buffers]
+            candidates = [Candidates(OPERATIONS[op], _buffer) for _buffer in buffers]
+            exponent = math.log(max(seconds[1], 1e-6) / max(seconds[0], 1e-6)) / math.log(_factor)
+            scanned = stride is None or all(count >= len(_buffer) // stride
+                                            for count, _buffer in zip(candidates, buffers))
+            results.append({'pattern': name, 'op': op, 'sizes': sizes, 'seconds': seconds,
+                            'candidates': candidates, 'exponent': exponent,
+                            'ok': exponent <= _max_exponent and scanned})
+    return results
+
+
+def Mutate(_random, _buffer):
+    """A few random flips, inserts, deletes, splices and length rewrites."""
+    out = bytearray(_buffer)
+    for i in range(_random.randrange(1, 16)):
+        kind = _random.randrange(5)
+        pos = _random.randrange(len(out) + 1)
+        if 0 == kind and pos < len(out):
+            out[pos] ^= 1 << _random.randrange(8)
+        elif 1 == kind:
+            out[pos:pos] = bytes(_random.getrandbits(8) for _ in range(_random.randrange(1, 64)))
+        elif 2 == kind:
+            del out[pos:pos + _random.randrange(1, 256)]
+        elif 3 == kind and len(out) > 0:
+            start = _random.randrange(len(out))
+            out[pos:pos] = out[start:start + _random.randrange(1, 4096)]
+        elif pos + 9 <= len(out):
+            out[pos + 5:pos + 9] = struct.pack("I", _random.choice([0, 1, 0xFFFF, 0xFFFFFFFF, len(out) - pos]))
+    return bytes(out)
+
+
+def Fuzz(_cases, _seed=1):
+    """
+    Run every operation on _cases mutated gen_log files; anything but
+    a clean return is reported.
+    """
+    decode_log.PRIV_KEY = gen_log.TEST_PRIV_KEY
+    fuzz_random = random.Random(_seed)
+    failures = []
+    for case in range(_cases):
+        seed = fuzz_random.randrange(1 << 30)
+        _random = random.Random(seed)
+        generator = gen_log.LogGenerator(lines=4, seed=seed)
+        _buffer = Mutate(_random, b"".join(generator.block()[0] for _ in range(_random.randrange(1, 24))))
+        for op in sorted(OPERATIONS):
+            try:
+                OPERATIONS[op](_buffer)
+            except Exception as e:
+                failures.append({'case': case, 'seed': seed, 'op': op, 'error': repr(e)})
+    return failures
+
+
+def main(args):
+    seed = 1
+    scale = 1.0
+    cases = 200
+    max_exponent = 1.5
+    patterns = None
+    for arg in args:
+        name, _, value = arg.partition('=')
+        if '--seed' == name:
+            seed = int(value)
+        elif '--scale' == name:
+            scale = float(value)
+        elif '--cases' == name:
+            cases = int(value)
+        elif '--max-exponent' == name:
+            max_exponent = float(value)
+        elif '--patterns' == name:
+            patterns = value.split(',')
+        else:
+            sys.stderr.write("usage: fuzz_log.py [--seed=N] [--scale=F] [--cases=N] [--max-exponent=F] "
+                             "[--patterns=%s]\n" % ",".join(sorted(PATTERNS)))
+            return 1
+
+    # DecodeBuffer prints a traceback for every block that fails to decompress
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stderr(devnull):
+        scaling = CheckScaling(seed, scale, _max_exponent=max_exponent, _patterns=patterns)
+        failures = Fuzz(cases, seed)
+
+    report = {'scaling': scaling, 'fuzz': {'cases': cases, 'failures': failures}}
+    sys.stdout.write(json.dumps(report, sort_keys=True, indent=2) + "\n")
+    return 0 if not failures and all(result['ok'] for result in scaling) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,230 @@
+import binascii
+import json
+import random
+import struct
+import sys
+import time
+import zlib
+
+import pyelliptic
+import zstandard as zstd
+
+import decode_log
+
+# test key pair for generated files, never use it for real logs:
+# decode with decode_log.PRIV_KEY = TEST_PRIV_KEY
+TEST_PRIV_KEY = "db612190c28da3a4f76ebd7d559684cbce0411faba8cafbdffdb20caee9881d6"
+TEST_PUB_KEY = "394d0dd430239152be8a77ae4e9ee4f4ba281704a98930f1139a48e20766f3d1" \
+               "c0c466177db3e9a678a59adad73737fcc1290f8763f4c21fc99ab503de3c5aa3"
+# the client side of the ECDH, its public key is what ends up in the block headers
+TEST_CLIENT_PRIV_KEY = "67d36cf900cfce65c912a886547742eb041754327f6bbea4235f7a710a59b2d8"
+TEST_CLIENT_PUB_KEY = "62fc72a5f6e9f0f83b517c65dd19e4c1e672e345fa6b629df61cebf98d07ab33" \
+                      "3f3dacdcc039833332371b2bf1ea82b77e7fc62198fe8867f6277340a280badc"
+
+MAGICS = [decode_log.MAGIC_NO_COMPRESS_START, decode_log.MAGIC_NO_COMPRESS_START1,
+          decode_log.MAGIC_NO_COMPRESS_NO_CRYPT_START, decode_log.MAGIC_COMPRESS_START,
+          decode_log.MAGIC_COMPRESS_START1, decode_log.MAGIC_COMPRESS_START2,
+          decode_log.MAGIC_COMPRESS_NO_CRYPT_START, decode_log.MAGIC_SYNC_ZSTD_START,
+          decode_log.MAGIC_SYNC_NO_CRYPT_ZSTD_START, decode_log.MAGIC_ASYNC_ZSTD_START,
+          decode_log.MAGIC_ASYNC_NO_CRYPT_ZSTD_START]
+
+LEVELS = b"VDIWEF"
+TAGS = [b"MicroMsg.NetSceneSync", b"MicroMsg.MMCore", b"MicroMsg.SDK", b"MicroMsg.Crash", b"mars::stn",
+        b"mars::sdt", b"MicroMsg.Plugin", b"MicroMsg.Voip"]
+FUNCS = [(b"longlink.cc", b"__RunReadWrite", 402), (b"shortlink.cc", b"__RunReadWrite", 287),
+         (b"net_core.cc", b"StartTask", 331), (b"appender.cc", b"__WriteAsync", 518),
+         (b"SyncService.java", b"onGYNetEnd", 96), (b"MMCore.java", b"onCreate", 1214)]
+WORDS = [b"uin", b"seq", b"cmdid", b"taskid", b"ret", b"errcode", b"cost", b"host", b"ip", b"port", b"retry",
+         b"timeout", b"send", b"recv", b"size", b"socket", b"connect", b"succ", b"fail", b"netid", b"msgid"]
+
+
+def tea_encipher(v, k):
+    op = 0xffffffff
+    v0, v1 = struct.unpack('=LL', v[0:8])
+    k1, k2, k3, k4 = struct.unpack('=LLLL', k[0:16])
+    delta = 0x9E3779B9
+    s = 0
+    for i in range(16):
+        s = (s + delta) & op
+        v0 = (v0 + (((v1 << 4) + k1) ^ (v1 + s) ^ ((v1 >> 5) + k2))) & op
+        v1 = (v1 + (((v0 << 4) + k3) ^ (v0 + s) ^ ((v0 >> 5) + k4))) & op
+    return struct.pack('=LL', v0, v1)
+
+
+def tea_encrypt(v, k):
+    """Inverse of decode_log.tea_decrypt: whole 8-byte words, the tail stays as is."""
+    num = int(len(v) / 8) * 8
+    return b''.join([tea_encipher(v[i:i + 8], k) for i in range(0, num, 8)]) + bytes(v[num:])
+
+
+def GetTestTeaKey():
+    client = pyelliptic.ECC(curve='secp256k1')
+    client.privkey = binascii.unhexlify(TEST_CLIENT_PRIV_KEY)
+    pub = binascii.unhexlify(TEST_PUB_KEY)
+    return client.raw_get_ecdh_key(pub[:32], pub[32:])
+
+
+class LogGenerator:
+    """
+    Produces xlog blocks that decode_log.py can read, one per call to
+    block(), from a seeded random source so that the same arguments always
+    give the same bytes. Every block carries lines lines of mars-style log
+    text whose clock moves forward from start_time.
+    """
+
+    def __init__(self, magics=None, lines=32, seed=0, start_time=1714530000):
+        self.random = random.Random(seed)
+        self.magics = magics or MAGICS
+        self.lines = lines
+        self.time = float(start_time)
+        self.seq = 0
+        self.pid = self.random.randrange(1000, 30000)
+        self.tea_key = GetTestTeaKey()
+        self.client_pubkey = binascii.unhexlify(TEST_CLIENT_PUB_KEY)
+
+    def text(self, count):
+        out = []
+        for i in range(count):
+            self.time += self.random.expovariate(20.0)
+            tm = time.gmtime(self.time + 8 * 3600)
+            filename, func, line = self.random.choice(FUNCS)
+            tid = self.pid if self.random.random() < 0.3 else self.pid + self.random.randrange(1, 64)
+            message = b" ".join([b"%s:%d" % (self.random.choice(WORDS), self.random.randrange(1 << 20))
+                                 for _ in range(self.random.randrange(1, 12))])
+            out.append(b"[%c][%s +8.0 %s.%03d][%d, %d%s][%s][%s, %s, %d][%s\n" % (
+                self.random.choice(LEVELS), time.strftime("%Y-%m-%d", tm).encode(),
+                time.strftime("%H:%M:%S", tm).encode(), int(self.time * 1000) % 1000,
+                self.pid, tid, b"*" if tid == self.pid else b"", self.random.choice(TAGS), filename, func, line,
+                message))
+        return b"".join(out)
+
+    def block(self, magic=None, plain=None, seq=None):
+        """Returns (block bytes, plain text) for the next block."""
+        if magic is None: magic = self.random.choice(self.magics)
+        if plain is None: plain = self.text(self.lines)
+        if seq is None:
+            self.seq = self.seq % 0xFFFF + 1
+            seq = self.seq
+
+        blocktype = decode_log.BLOCK_TYPES[magic]
+        if 'deflate' == blocktype.compress:
+            body = Deflate(plain)
+        elif 'deflate_segments' == blocktype.compress:
+            # deflate output cut into u16-length-prefixed pieces
+            data = Deflate(plain)
+            body = b"".join([struct.pack("H", len(data[i:i + 4096])) + data[i:i + 4096]
+                             for i in range(0, len(data), 4096)])
+        elif 'zstd' == blocktype.compress:
+            body = zstd.ZstdCompressor().compress(plain)
+        else:
+            body = plain
+        if 'tea' == blocktype.crypt:
+            body = tea_encrypt(body, self.tea_key)
+
+        if 64 == blocktype.crypt_key_len:
+            crypt_key = self.client_pubkey
+        else:
+            crypt_key = b"\0" * blocktype.crypt_key_len
+
+        hour = int((self.time + 8 * 3600) / 3600) % 24
+        header = decode_log.HEADER.pack(magic, seq, hour, hour, len(body))
+        return header + crypt_key + body + struct.pack("B", decode_log.MAGIC_END), plain
+
+
+def Deflate(_data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(_data) + compressor.flush()
+
+
+def Corrupt(_random, _block):
+    """Damage a block the ways real uploads get damaged; returns (bytes, kind)."""
+    kind = _random.choice(['garbage', 'truncated', 'bad_end', 'bad_length'])
+    if 'garbage' == kind:
+        return bytes(_random.getrandbits(8) for _ in range(_random.randrange(1, 256))) + _block, kind
+    if 'truncated' == kind:
+        return _block[:_random.randrange(1, len(_block))], kind
+    if 'bad_end' == kind:
+        return _block[:-1] + b"\xff", kind
+    return _block[:5] + struct.pack("I", _random.getrandbits(32)) + _block[9:], kind
+
+
+def GenerateFile(_outfile, _size, magics=None, lines=32, seed=0, gap_rate=0.0, corrupt_rate=0.0, plainfile=None):
+    """
+    Write blocks to _outfile until it reaches _size bytes. With gap_rate
+    some seq numbers are skipped and with corrupt_rate some blocks are
+    damaged (see Corrupt). Blocks are written as they are made, so
+    memory does not grow with _size. If plainfile is given, the text of
+    every block is written there as well. Returns a summary dict.
+    """
+    generator = LogGenerator(magics, lines, seed)
+    faults = random.Random(seed + 1)
+    summary = {'size': 0, 'blocks': 0, 'lines': 0, 'magic': {}, 'seq_gaps': 0, 'corrupted': {}}
+    fpout = open(_outfile, "wb")
+    fpplain = open(plainfile, "wb") if plainfile is not None else None
+    try:
+        while summary['size'] < _size:
+            if gap_rate and faults.random() < gap_rate:
+                generator.seq += faults.randrange(1, 8)
+                summary['seq_gaps'] += 1
+            data, plain = generator.block()
+            magic = '0x%02X' % data[0]
+            summary['magic'][magic] = summary['magic'].get(magic, 0) + 1
+            if corrupt_rate and faults.random() < corrupt_rate:
+                data, kind = Corrupt(faults, data)
+                summary['corrupted'][kind] = summary['corrupted'].get(kind, 0) + 1
+            fpout.write(data)
+            if fpplain is not None: fpplain.write(plain)
+            summary['size'] += len(data)
+            summary['blocks'] += 1
+            summary['lines'] += lines
+    finally:
+        fpout.close()
+        if fpplain is not None: fpplain.close()
+    return summary
+
+
+def ParseSize(_size):
+    units = {'K': 1024, 'M': 1024 * 1024, 'G': 1024 * 1024 * 1024}
+    if _size[-1:].upper() in units:
+        return int(float(_size[:-1]) * units[_size[-1:].upper()])
+    return int(_size)
+
+
+def main(args):
+    options = {}
+    size = 1024 * 1024
+    outfile = None
+    for arg in args:
+        name, _, value = arg.partition('=')
+        if '--size' == name:
+            size = ParseSize(value)
+        elif '--magics' == name:
+            options['magics'] = [int(magic, 16) for magic in value.split(',')]
+        elif name in ('--lines', '--seed'):
+            options[name[2:]] = int(value)
+        elif name in ('--gap-rate', '--corrupt-rate'):
+            options[name[2:].replace('-', '_')] = float(value)
+        elif '--plain' == name:
+            options['plainfile'] = value
+        elif name.startswith('--'):
+            sys.stderr.write("unknown option %s\n" % arg)
+            return 1
+        else:
+            outfile = arg
+
+    if outfile is None:
+        sys.stderr.write("usage: gen_log.py [--size=100M] [--magics=03,07,0C,...] [--lines=N] [--seed=N] "
+                         "[--gap-rate=R] [--corrupt-rate=R] [--plain=FILE] out.xlog\n")
+        return 1
+
+    for magic in options.get('magics', []):
+        if magic not in MAGICS:
+            sys.stderr.write("unknown magic 0x%02X\n" % magic)
+            return 1
+
+    sys.stdout.write(json.dumps(GenerateFile(outfile, size, **options), sort_keys=True) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
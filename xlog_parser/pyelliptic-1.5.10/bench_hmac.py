@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare the HMAC backends of pyelliptic.hash:
+
+    python bench_hmac.py [--sizes=64,4096,1048576] [--repeat=N]
+
+prints, for every message size, MB/s of the one-shot MAC through the
+standard library (hmac.new().digest(), as hmac_sha256 does) and through
+libcrypto's HMAC() with ctypes, and of the incremental objects of both
+backends started from a keyed copy.
+"""
+
+import json
+import sys
+import time
+
+from pyelliptic import OpenSSL
+from pyelliptic import hash as _hash
+
+
+def measure(func, size, repeat):
+    """Best of repeat runs of func(), as MB/s over size bytes"""
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return size / (1024.0 * 1024.0) / max(best, 1e-9)
+
+
+def openssl_oneshot(key, msg):
+    k, key_len = OpenSSL.buffer(key)
+    d, size = OpenSSL.buffer(msg)
+    md = OpenSSL.malloc(0, 32)
+    OpenSSL.HMAC(OpenSSL.EVP_sha256(), k, key_len, d, size, md, None)
+    return md.raw
+
+
+def run(sizes, repeat):
+    key = b"k" * 32
+    results = {}
+    for size in sizes:
+        msg = b"m" * size
+        count = max(1, (16 << 20) // max(size, 1))
+        total = size * count
+        templates = dict((backend, _hash.new(key, backend=backend))
+                         for backend in ('hashlib', 'openssl'))
+
+        def oneshot(func):
+            return lambda: [func(key, msg) for i in range(count)]
+
+        def incremental(template):
+            def run_copies():
+                for i in range(count):
+                    mac = template.copy()
+                    mac.update(msg)
+                    mac.digest()
+            return run_copies
+
+        results['oneshot.hashlib.%d' % size] = measure(oneshot(_hash.hmac_sha256), total, repeat)
+        results['oneshot.openssl.%d' % size] = measure(oneshot(openssl_oneshot), total, repeat)
+        for backend, template in templates.items():
+            results['incremental.%s.%d' % (backend, size)] = measure(incremental(template), total, repeat)
+    return results
+
+
+def main(args):
+    sizes = [64, 4096, 1 << 20]
+    repeat = 3
+    for arg in args:
+        name, _, value = arg.partition('=')
+        if name == '--sizes':
+            sizes = [int(size) for size in value.split(',')]
+        elif name == '--repeat':
+            repeat = int(value)
+        else:
+            sys.stderr.write("usage: bench_hmac.py [--sizes=64,4096,1048576] [--repeat=N]\n")
+            return 1
+    report = {'unit': 'MB/s', 'results': run(sizes, repeat)}
+    sys.stdout.write(json.dumps(report, sort_keys=True, indent=2) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
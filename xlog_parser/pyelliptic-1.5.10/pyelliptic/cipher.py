@@ -30,6 +30,9 @@
 # IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 from .openssl import OpenSSL
+from .openssl import EVP_CTRL_AEAD_SET_IVLEN, EVP_CTRL_AEAD_GET_TAG, EVP_CTRL_AEAD_SET_TAG
+
+TAG_SIZE = 16
 
 
 class Cipher:
@@ -45,6 +48,22 @@ class Cipher:
 
         ctx2 = pyelliptic.Cipher("secretkey", iv, 0, ciphername='aes-256-cfb')
         print ctx2.ciphering(ciphertext)
+
+    For many messages, reset() the same object with the next key or IV
+    and write into a preallocated buffer with update_into() and
+    final_into(), so that nothing is allocated per message:
+
+        out = bytearray(4096 + ctx.block_size)
+        for iv, message in messages:
+            ctx.reset(None, iv)
+            n = ctx.update_into(message, out)
+            n += ctx.final_into(memoryview(out)[n:])
+
+    AEAD ciphers (aes-128-gcm, aes-256-gcm, chacha20-poly1305) also
+    authenticate: pass associated data to update_aad() before the
+    message, read the tag with get_tag() after final() when encrypting,
+    and give it to set_tag() before final() when decrypting; final()
+    raises if the message or the associated data was modified.
     """
     def __init__(self, key, iv, do, ciphername='aes-256-cbc'):
         """
@@ -53,13 +72,58 @@ class Cipher:
         self.cipher = OpenSSL.get_cipher(ciphername)
         self.ctx = OpenSSL.EVP_CIPHER_CTX_new()
         if do == 1 or do == 0:
-            k = OpenSSL.malloc(key, len(key))
-            IV = OpenSSL.malloc(iv, len(iv))
-            OpenSSL.EVP_CipherInit_ex(
-                self.ctx, self.cipher.get_pointer(), 0, k, IV, do)
+            self.do = do
+            cipher = self.cipher.get_pointer()
+            self.block_size = OpenSSL.EVP_CIPHER_block_size(cipher)
+            k = OpenSSL.buffer(key)[0]
+            IV, iv_len = OpenSSL.buffer(iv)
+            if self.cipher.is_aead():
+                OpenSSL.EVP_CipherInit_ex(self.ctx, cipher, 0, None, None, do)
+                self._ctrl(EVP_CTRL_AEAD_SET_IVLEN, iv_len, None)
+                cipher = None
+            OpenSSL.EVP_CipherInit_ex(self.ctx, cipher, 0, k, IV, do)
         else:
             raise Exception("RTFM ...")
 
+    def reset(self, key, iv):
+        """
+        Start a new message on the same context: key None keeps the
+        current key schedule and only the IV changes
+        """
+        k = OpenSSL.buffer(key)[0] if key is not None else None
+        IV = OpenSSL.buffer(iv)[0] if iv is not None else None
+        if OpenSSL.EVP_CipherInit_ex(self.ctx, None, None, k, IV, self.do) == 0:
+            raise Exception("[OpenSSL] EVP_CipherInit_ex FAIL ...")
+
+    def _ctrl(self, command, arg, ptr):
+        if OpenSSL.EVP_CIPHER_CTX_ctrl(self.ctx, command, arg, ptr) != 1:
+            raise Exception("[OpenSSL] EVP_CIPHER_CTX_ctrl FAIL ... " + OpenSSL.get_error())
+
+    def update_aad(self, data):
+        """
+        AEAD only: authenticate data without encrypting it; call before
+        update()
+        """
+        i = OpenSSL.c_int(0)
+        inp, size = OpenSSL.buffer(data)
+        if OpenSSL.EVP_CipherUpdate(self.ctx, None, OpenSSL.byref(i),
+                                    inp, size) == 0:
+            raise Exception("[OpenSSL] EVP_CipherUpdate FAIL ...")
+
+    def get_tag(self):
+        """
+        AEAD only: returns the tag of the message encrypted, after final()
+        """
+        tag = OpenSSL.malloc(0, TAG_SIZE)
+        self._ctrl(EVP_CTRL_AEAD_GET_TAG, TAG_SIZE, tag)
+        return tag.raw
+
+    def set_tag(self, tag):
+        """
+        AEAD only: the tag that final() checks the decrypted message against
+        """
+        self._ctrl(EVP_CTRL_AEAD_SET_TAG, len(tag), OpenSSL.buffer(tag)[0])
+
     @staticmethod
     def get_all_cipher():
         """
@@ -77,14 +141,47 @@ class Cipher:
         cipher = OpenSSL.get_cipher(ciphername)
         return OpenSSL.rand(cipher.get_blocksize())
 
+    @staticmethod
+    def encrypt_stream(src, dst, key, iv, ciphername='aes-256-cbc',
+                       chunk_size=1 << 20):
+        """
+        static method, encrypts the file object src into dst chunk by
+        chunk; returns the number of bytes written
+        """
+        return Cipher(key, iv, 1, ciphername).ciphering_stream(
+            src, dst, chunk_size)
+
+    @staticmethod
+    def decrypt_stream(src, dst, key, iv, ciphername='aes-256-cbc',
+                       chunk_size=1 << 20):
+        """
+        static method, decrypts the file object src into dst chunk by
+        chunk; returns the number of bytes written
+        """
+        return Cipher(key, iv, 0, ciphername).ciphering_stream(
+            src, dst, chunk_size)
+
     def update(self, input):
         i = OpenSSL.c_int(0)
-        buffer = OpenSSL.malloc(b"", len(input) + self.cipher.get_blocksize())
-        inp = OpenSSL.malloc(input, len(input))
+        inp, size = OpenSSL.buffer(input)
+        buffer = OpenSSL.malloc(0, size + self.cipher.get_blocksize())
         if OpenSSL.EVP_CipherUpdate(self.ctx, OpenSSL.byref(buffer),
-                                    OpenSSL.byref(i), inp, len(input)) == 0:
+                                    OpenSSL.byref(i), inp, size) == 0:
+            raise Exception("[OpenSSL] EVP_CipherUpdate FAIL ...")
+        return OpenSSL.string_at(buffer, i.value)
+
+    def update_into(self, input, out):
+        """
+        Write the output for input into the writable buffer out, which
+        needs len(input) + block_size - 1 bytes; returns the length written
+        """
+        i = OpenSSL.c_int(0)
+        inp, size = OpenSSL.buffer(input)
+        buffer = OpenSSL.output_buffer(out, size + self.block_size - 1)
+        if OpenSSL.EVP_CipherUpdate(self.ctx, buffer, OpenSSL.byref(i),
+                                    inp, size) == 0:
             raise Exception("[OpenSSL] EVP_CipherUpdate FAIL ...")
-        return buffer.raw[0:i.value]
+        return i.value
 
     def final(self):
         i = OpenSSL.c_int(0)
@@ -92,7 +189,19 @@ class Cipher:
         if (OpenSSL.EVP_CipherFinal_ex(self.ctx, OpenSSL.byref(buffer),
                                        OpenSSL.byref(i))) == 0:
             raise Exception("[OpenSSL] EVP_CipherFinal_ex FAIL ...")
-        return buffer.raw[0:i.value]
+        return OpenSSL.string_at(buffer, i.value)
+
+    def final_into(self, out):
+        """
+        Write the last block into out, which needs block_size bytes;
+        returns the length written
+        """
+        i = OpenSSL.c_int(0)
+        buffer = OpenSSL.output_buffer(out, self.block_size)
+        if (OpenSSL.EVP_CipherFinal_ex(self.ctx, buffer,
+                                       OpenSSL.byref(i))) == 0:
+            raise Exception("[OpenSSL] EVP_CipherFinal_ex FAIL ...")
+        return i.value
 
     def ciphering(self, input):
         """
@@ -101,6 +210,32 @@ class Cipher:
         buff = self.update(input)
         return buff + self.final()
 
+    def ciphering_stream(self, src, dst, chunk_size=1 << 20):
+        """
+        Do update and final over the file object src, writing to dst;
+        memory use stays at two buffers of chunk_size whatever the size
+        of src. Returns the number of bytes written
+        """
+        inbuf = bytearray(chunk_size)
+        inview = memoryview(inbuf)
+        out = bytearray(chunk_size + self.block_size)
+        outview = memoryview(out)
+        readinto = getattr(src, 'readinto', None)
+        total = 0
+        while True:
+            if readinto is not None:
+                data = inview[:readinto(inbuf) or 0]
+            else:
+                data = src.read(chunk_size)
+            if not len(data):
+                break
+            n = self.update_into(data, out)
+            dst.write(outview[:n])
+            total += n
+        n = self.final_into(out)
+        dst.write(outview[:n])
+        return total + n
+
     def __del__(self):
         if OpenSSL.using_openssl_1_1:
             OpenSSL.EVP_CIPHER_CTX_reset(self.ctx)
@@ -29,13 +29,17 @@
 # OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN
 # IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-from hashlib import sha512
+from hashlib import sha256, sha512
 from binascii import hexlify, unhexlify
 from .openssl import OpenSSL
-from .cipher import Cipher
+from .cipher import Cipher, TAG_SIZE
 from .hash import hmac_sha256, equals
 from struct import pack, unpack
 
+# streaming ECIES: largest segment a header may ask the reader to buffer
+# (the segment size is not authenticated until the first tag is checked)
+MAX_SEGMENT_SIZE = 4 << 20
+
 
 class ECC:
     """
@@ -65,6 +69,14 @@ class ECC:
         print alice.get_ecdh_key(bob.get_pubkey()).encode('hex')
         print bob.get_ecdh_key(alice.get_pubkey()).encode('hex')
 
+    The OpenSSL EC_KEY behind an object is built once and reused by every
+    ECDH, sign and verify call until close(); use the object as a context
+    manager to free it deterministically:
+
+        with pyelliptic.ECC(curve='secp256k1', ...) as server:
+            for pubkey in clients:
+                server.get_ecdh_key(pubkey)
+
     """
 
     def __init__(self, pubkey=None, privkey=None, pubkey_x=None,
@@ -73,6 +85,7 @@ class ECC:
         For a normal and High level use, specifie pubkey,
         privkey (if you need) and the curve
         """
+        self._key = None
         if type(curve) == str:
             self.curve = OpenSSL.get_curve(curve)
         else:
@@ -86,18 +99,144 @@ class ECC:
                 raw_privkey = ECC._decode_privkey(privkey)
             self._set_keys(pubkey_x, pubkey_y, raw_privkey)
         else:
-            self.privkey, self.pubkey_x, self.pubkey_y = self._generate()
+            self._privkey, self._pubkey_x, self._pubkey_y, key = self._generate()
+            self._set_native_key(key)
+            self._checked = True
 
     def _set_keys(self, pubkey_x, pubkey_y, privkey):
-        if self.raw_check_key(privkey, pubkey_x, pubkey_y) < 0:
-            self.pubkey_x = None
-            self.pubkey_y = None
-            self.privkey = None
-            raise Exception("Bad ECC keys ...")
-        else:
-            self.pubkey_x = pubkey_x
-            self.pubkey_y = pubkey_y
-            self.privkey = privkey
+        self.close()
+        self._pubkey_x = pubkey_x
+        self._pubkey_y = pubkey_y
+        self._privkey = privkey
+        try:
+            self._check_key()
+        except Exception:
+            self.close()
+            self._pubkey_x = None
+            self._pubkey_y = None
+            self._privkey = None
+            raise
+
+    # assigning any part of the key pair drops the native key built from the old one
+    @property
+    def privkey(self):
+        return self._privkey
+
+    @privkey.setter
+    def privkey(self, privkey):
+        self.close()
+        self._privkey = privkey
+
+    @property
+    def pubkey_x(self):
+        return self._pubkey_x
+
+    @pubkey_x.setter
+    def pubkey_x(self, pubkey_x):
+        self.close()
+        self._pubkey_x = pubkey_x
+
+    @property
+    def pubkey_y(self):
+        return self._pubkey_y
+
+    @pubkey_y.setter
+    def pubkey_y(self, pubkey_y):
+        self.close()
+        self._pubkey_y = pubkey_y
+
+    def _new_key(self, privkey, pubkey_x, pubkey_y):
+        """
+        Returns a new EC_KEY on this curve with the given parts set
+        (None to leave one out); the caller frees it.
+        """
+        key = OpenSSL.EC_KEY_new_by_curve_name(self.curve)
+        if not key:
+            raise Exception("[OpenSSL] EC_KEY_new_by_curve_name FAIL ... " + OpenSSL.get_error())
+        priv_key = pub_key_x = pub_key_y = pub_key = None
+        try:
+            if privkey is not None:
+                priv_key = OpenSSL.BN_bin2bn(privkey, len(privkey), 0)
+                if (OpenSSL.EC_KEY_set_private_key(key, priv_key)) == 0:
+                    raise Exception("[OpenSSL] EC_KEY_set_private_key FAIL ... " + OpenSSL.get_error())
+
+            if pubkey_x is not None and pubkey_y is not None:
+                pub_key_x = OpenSSL.BN_bin2bn(pubkey_x, len(pubkey_x), 0)
+                pub_key_y = OpenSSL.BN_bin2bn(pubkey_y, len(pubkey_y), 0)
+                group = OpenSSL.EC_KEY_get0_group(key)
+                pub_key = OpenSSL.EC_POINT_new(group)
+                if (OpenSSL.EC_POINT_set_affine_coordinates_GFp(group, pub_key,
+                                                                pub_key_x,
+                                                                pub_key_y,
+                                                                0)) == 0:
+                    raise Exception(
+                        "[OpenSSL] EC_POINT_set_affine_coordinates_GFp FAIL ... " + OpenSSL.get_error())
+                if (OpenSSL.EC_KEY_set_public_key(key, pub_key)) == 0:
+                    raise Exception("[OpenSSL] EC_KEY_set_public_key FAIL ... " + OpenSSL.get_error())
+        except Exception:
+            OpenSSL.EC_KEY_free(key)
+            raise
+        finally:
+            # EC_KEY_set_private_key and EC_KEY_set_public_key keep copies
+            OpenSSL.BN_free(priv_key)
+            OpenSSL.BN_free(pub_key_x)
+            OpenSSL.BN_free(pub_key_y)
+            OpenSSL.EC_POINT_free(pub_key)
+        return key
+
+    def _set_native_key(self, key):
+        self._key = key
+        self._group = OpenSSL.EC_KEY_get0_group(key)
+        self._checked = False
+        if not OpenSSL.using_openssl_1_1:
+            OpenSSL.ECDH_set_method(key, OpenSSL.ECDH_OpenSSL())
+
+        # on curves with a cofactor a point on the curve may still lie
+        # outside the group, so peer keys get the full EC_KEY_check_key
+        cofactor = OpenSSL.BN_new()
+        try:
+            OpenSSL.EC_GROUP_get_cofactor(self._group, cofactor, 0)
+            self._cofactor_one = OpenSSL.BN_num_bits(cofactor) == 1
+        finally:
+            OpenSSL.BN_free(cofactor)
+
+    def _native_key(self):
+        """
+        The EC_KEY holding this object's keys, built on first use and
+        kept until close() or until a key attribute is assigned.
+        """
+        if self._key is None:
+            self._set_native_key(self._new_key(self._privkey, self._pubkey_x, self._pubkey_y))
+        return self._key
+
+    def _check_key(self):
+        key = self._native_key()
+        if not self._checked:
+            if (OpenSSL.EC_KEY_check_key(key)) == 0:
+                raise Exception("[OpenSSL] EC_KEY_check_key FAIL ... " + OpenSSL.get_error())
+            self._checked = True
+        return key
+
+    def close(self):
+        """
+        Free the native key. The object stays usable, the key is built
+        again when it is next needed.
+        """
+        if self._key is not None:
+            OpenSSL.EC_KEY_free(self._key)
+            self._key = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass  # OpenSSL may already be gone at interpreter exit
 
     @staticmethod
     def get_curves():
@@ -217,7 +356,7 @@ class ECC:
             pub_key_y = OpenSSL.BN_new()
 
             key = OpenSSL.EC_KEY_new_by_curve_name(self.curve)
-            if key == 0:
+            if not key:
                 raise Exception("[OpenSSL] EC_KEY_new_by_curve_name FAIL ... " + OpenSSL.get_error())
             if (OpenSSL.EC_KEY_generate_key(key)) == 0:
                 raise Exception("[OpenSSL] EC_KEY_generate_key FAIL ... " + OpenSSL.get_error())
@@ -253,12 +392,13 @@ class ECC:
             if len(pubkeyy) < secret_len:
                 pubkeyy = pubkeyy.rjust(secret_len, b'\0')
 
-            self.raw_check_key(privkey, pubkeyx, pubkeyy)
+            return privkey, pubkeyx, pubkeyy, key
 
-            return privkey, pubkeyx, pubkeyy
+        except Exception:
+            OpenSSL.EC_KEY_free(key)
+            raise
 
         finally:
-            OpenSSL.EC_KEY_free(key)
             OpenSSL.BN_free(pub_key_x)
             OpenSSL.BN_free(pub_key_y)
 
@@ -271,65 +411,95 @@ class ECC:
         return self.raw_get_ecdh_key(pubkey_x, pubkey_y)
 
     def raw_get_ecdh_key(self, pubkey_x, pubkey_y):
+        return self.raw_get_ecdh_keys([(pubkey_x, pubkey_y)])[0]
+
+    def get_ecdh_keys(self, pubkeys, format='binary', threads=None):
+        """
+        get_ecdh_key for many peer public keys in one call; returns the
+        shared keys in the same order. The native key is shared and every
+        thread reuses one BN_CTX. With threads > 1 the peers are split
+        between that many threads, ctypes releases the GIL while OpenSSL
+        does the point multiplications.
+        """
+        return self.raw_get_ecdh_keys(
+            [ECC._decode_pubkey(pubkey, format) for pubkey in pubkeys], threads)
+
+    def raw_get_ecdh_keys(self, pubkeys, threads=None):
+        """
+        get_ecdh_keys with the peers given as (pubkey_x, pubkey_y) pairs
+        """
+        key = self._native_key()
+        if not threads or threads <= 1 or len(pubkeys) <= 1:
+            return self._ecdh_batch(key, pubkeys)
+
+        from concurrent.futures import ThreadPoolExecutor
+        size = -(-len(pubkeys) // threads)
+        parts = [pubkeys[i:i + size] for i in range(0, len(pubkeys), size)]
+        with ThreadPoolExecutor(len(parts)) as pool:
+            results = list(pool.map(lambda part: self._ecdh_batch(key, part), parts))
+        return [ecdh_key for part in results for ecdh_key in part]
+
+    def _ecdh_batch(self, key, pubkeys):
+        ctx = OpenSSL.BN_CTX_new()
+        if not ctx:
+            raise Exception("[OpenSSL] BN_CTX_new FAIL ... " + OpenSSL.get_error())
         try:
+            ecdh_keys = []
             ecdh_keybuffer = OpenSSL.malloc(0, 32)
+            for pubkey_x, pubkey_y in pubkeys:
+                other_pub_key = self._peer_point(pubkey_x, pubkey_y, ctx)
+                try:
+                    if OpenSSL.using_openssl_1_1:
+                        ecdh_keylen = self.ecdh_compute_key(
+                            ecdh_keybuffer, 32, other_pub_key, key, ctx)
+                    else:
+                        ecdh_keylen = OpenSSL.ECDH_compute_key(
+                            ecdh_keybuffer, 32, other_pub_key, key, 0)
+                finally:
+                    OpenSSL.EC_POINT_free(other_pub_key)
+
+                if ecdh_keylen != 32:
+                    raise Exception("[OpenSSL] ECDH keylen FAIL ... " + OpenSSL.get_error())
+                ecdh_keys.append(ecdh_keybuffer.raw)
+            return ecdh_keys
 
-            other_key = OpenSSL.EC_KEY_new_by_curve_name(self.curve)
-            if other_key == 0:
-                raise Exception("[OpenSSL] EC_KEY_new_by_curve_name FAIL ... " + OpenSSL.get_error())
-
-            other_pub_key_x = OpenSSL.BN_bin2bn(pubkey_x, len(pubkey_x), 0)
-            other_pub_key_y = OpenSSL.BN_bin2bn(pubkey_y, len(pubkey_y), 0)
+        finally:
+            OpenSSL.BN_CTX_free(ctx)
 
-            other_group = OpenSSL.EC_KEY_get0_group(other_key)
-            other_pub_key = OpenSSL.EC_POINT_new(other_group)
-            if (other_pub_key == None):
+    def _peer_point(self, pubkey_x, pubkey_y, ctx=0):
+        """
+        Returns a new EC_POINT for a peer public key on this curve after
+        checking it; the caller frees it.
+        """
+        other_pub_key_x = OpenSSL.BN_bin2bn(pubkey_x, len(pubkey_x), 0)
+        other_pub_key_y = OpenSSL.BN_bin2bn(pubkey_y, len(pubkey_y), 0)
+        other_pub_key = OpenSSL.EC_POINT_new(self._group)
+        try:
+            if not other_pub_key:
                 raise Exception("[OpenSSl] EC_POINT_new FAIL ... " + OpenSSL.get_error())
-
-            if (OpenSSL.EC_POINT_set_affine_coordinates_GFp(other_group,
+            if (OpenSSL.EC_POINT_set_affine_coordinates_GFp(self._group,
                                                             other_pub_key,
                                                             other_pub_key_x,
                                                             other_pub_key_y,
-                                                            0)) == 0:
+                                                            ctx)) == 0:
                 raise Exception(
                     "[OpenSSL] EC_POINT_set_affine_coordinates_GFp FAIL ..." + OpenSSL.get_error())
-            if (OpenSSL.EC_KEY_set_public_key(other_key, other_pub_key)) == 0:
-                raise Exception("[OpenSSL] EC_KEY_set_public_key FAIL ... " + OpenSSL.get_error())
-            if (OpenSSL.EC_KEY_check_key(other_key)) == 0:
-                raise Exception("[OpenSSL] EC_KEY_check_key FAIL ... " + OpenSSL.get_error())
-
-            own_key = OpenSSL.EC_KEY_new_by_curve_name(self.curve)
-            if own_key == 0:
-                raise Exception("[OpenSSL] EC_KEY_new_by_curve_name FAIL ... " + OpenSSL.get_error())
-            own_priv_key = OpenSSL.BN_bin2bn(
-                self.privkey, len(self.privkey), 0)
-
-            if (OpenSSL.EC_KEY_set_private_key(own_key, own_priv_key)) == 0:
-                raise Exception("[OpenSSL] EC_KEY_set_private_key FAIL ... " + OpenSSL.get_error())
-
-            if OpenSSL.using_openssl_1_1:
-                ecdh_keylen = self.ecdh_compute_key(
-                    ecdh_keybuffer, 32, other_pub_key, own_key)
-            else:
-                OpenSSL.ECDH_set_method(own_key, OpenSSL.ECDH_OpenSSL())
-                ecdh_keylen = OpenSSL.ECDH_compute_key(
-                    ecdh_keybuffer, 32, other_pub_key, own_key, 0)
-
-            if ecdh_keylen != 32:
-                raise Exception("[OpenSSL] ECDH keylen FAIL ... " + OpenSSL.get_error())
-
-            return ecdh_keybuffer.raw
-
+            if (OpenSSL.EC_POINT_is_on_curve(self._group, other_pub_key, ctx)) != 1:
+                raise Exception("[OpenSSL] EC_POINT_is_on_curve FAIL ... " + OpenSSL.get_error())
+            if not self._cofactor_one:
+                self.raw_check_key(None, pubkey_x, pubkey_y)
+        except Exception:
+            OpenSSL.EC_POINT_free(other_pub_key)
+            raise
         finally:
-            OpenSSL.EC_KEY_free(other_key)
             OpenSSL.BN_free(other_pub_key_x)
             OpenSSL.BN_free(other_pub_key_y)
-            OpenSSL.EC_POINT_free(other_pub_key)
-            OpenSSL.EC_KEY_free(own_key)
-            OpenSSL.BN_free(own_priv_key)
+        return other_pub_key
 
-    def ecdh_compute_key(self, out, outlen, pubkey, ec_key):
+    def ecdh_compute_key(self, out, outlen, pubkey, ec_key, ctx=None):
         # Based on crypto/ecdh/ech_ossl.c (ecdh_compute_key)
+        # A BN_CTX passed in is borrowed (and reused across calls by
+        # _ecdh_batch), otherwise one is made for this call.
         INT_MAX = 2147483637
         NID_X9_62_prime_field = 406
 
@@ -339,7 +509,9 @@ class ECC:
 
         point = None
         buf = None
-        ctx = OpenSSL.BN_CTX_new()
+        own_ctx = ctx is None
+        if own_ctx:
+            ctx = OpenSSL.BN_CTX_new()
 
         if not ctx:
             raise Exception("[OpenSSL] ecdh_compute_key BN_CTX_new FAIL ... " +
@@ -419,7 +591,8 @@ class ECC:
         finally:
             if point:
                 OpenSSL.EC_POINT_free(point)
-            if ctx:
+            OpenSSL.BN_CTX_end(ctx)
+            if own_ctx:
                 OpenSSL.BN_CTX_free(ctx)
             if buf:
                 OpenSSL.memset(buf, 0, buf_length)
@@ -438,182 +611,79 @@ class ECC:
         return self.raw_check_key(raw_privkey, pubkey_x, pubkey_y)
 
     def raw_check_key(self, privkey, pubkey_x, pubkey_y):
-        curve = self.curve
+        key = self._new_key(privkey, pubkey_x, pubkey_y)
         try:
-            key = OpenSSL.EC_KEY_new_by_curve_name(curve)
-            if key == 0:
-                raise Exception("[OpenSSL] EC_KEY_new_by_curve_name FAIL ... " + OpenSSL.get_error())
-            if privkey is not None:
-                priv_key = OpenSSL.BN_bin2bn(privkey, len(privkey), 0)
-            pub_key_x = OpenSSL.BN_bin2bn(pubkey_x, len(pubkey_x), 0)
-            pub_key_y = OpenSSL.BN_bin2bn(pubkey_y, len(pubkey_y), 0)
-
-            if privkey is not None:
-                if (OpenSSL.EC_KEY_set_private_key(key, priv_key)) == 0:
-                    raise Exception(
-                        "[OpenSSL] EC_KEY_set_private_key FAIL ... " + OpenSSL.get_error())
-
-            group = OpenSSL.EC_KEY_get0_group(key)
-            pub_key = OpenSSL.EC_POINT_new(group)
-
-            if (OpenSSL.EC_POINT_set_affine_coordinates_GFp(group, pub_key,
-                                                            pub_key_x,
-                                                            pub_key_y,
-                                                            0)) == 0:
-                raise Exception(
-                    "[OpenSSL] EC_POINT_set_affine_coordinates_GFp FAIL ... " + OpenSSL.get_error())
-            if (OpenSSL.EC_KEY_set_public_key(key, pub_key)) == 0:
-                raise Exception("[OpenSSL] EC_KEY_set_public_key FAIL ... " + OpenSSL.get_error())
             if (OpenSSL.EC_KEY_check_key(key)) == 0:
                 raise Exception("[OpenSSL] EC_KEY_check_key FAIL ... " + OpenSSL.get_error())
             return 0
 
         finally:
             OpenSSL.EC_KEY_free(key)
-            OpenSSL.BN_free(pub_key_x)
-            OpenSSL.BN_free(pub_key_y)
-            OpenSSL.EC_POINT_free(pub_key)
-            if privkey is not None:
-                OpenSSL.BN_free(priv_key)
 
-    def sign(self, inputb):
+    def sign(self, inputb, check=True):
         """
         Sign the input with ECDSA method and returns the signature
         """
-        try:
-            size = len(inputb)
-            buff = OpenSSL.malloc(inputb, size)
-            digest = OpenSSL.malloc(0, 64)
-            dgst_len = OpenSSL.pointer(OpenSSL.c_int(0))
-            siglen = OpenSSL.pointer(OpenSSL.c_int(0))
-            sig = OpenSSL.malloc(0, 151)
-
-            if OpenSSL.using_openssl_1_1:
-                md_ctx = OpenSSL.EVP_MD_CTX_new()
-            else:
-                md_ctx = OpenSSL.EVP_MD_CTX_create()
-
-            key = OpenSSL.EC_KEY_new_by_curve_name(self.curve)
-            if key == 0:
-                raise Exception("[OpenSSL] EC_KEY_new_by_curve_name FAIL ... " + OpenSSL.get_error())
-
-            priv_key = OpenSSL.BN_bin2bn(self.privkey, len(self.privkey), 0)
-            pub_key_x = OpenSSL.BN_bin2bn(self.pubkey_x, len(self.pubkey_x), 0)
-            pub_key_y = OpenSSL.BN_bin2bn(self.pubkey_y, len(self.pubkey_y), 0)
-
-            if (OpenSSL.EC_KEY_set_private_key(key, priv_key)) == 0:
-                raise Exception("[OpenSSL] EC_KEY_set_private_key FAIL ... " + OpenSSL.get_error())
+        return self.sign_digest(sha256(OpenSSL.buffer(inputb)[0]).digest(), check)
 
-            group = OpenSSL.EC_KEY_get0_group(key)
-            pub_key = OpenSSL.EC_POINT_new(group)
-
-            if (OpenSSL.EC_POINT_set_affine_coordinates_GFp(group, pub_key,
-                                                            pub_key_x,
-                                                            pub_key_y,
-                                                            0)) == 0:
-                raise Exception(
-                    "[OpenSSL] EC_POINT_set_affine_coordinates_GFp FAIL ... " + OpenSSL.get_error())
-            if (OpenSSL.EC_KEY_set_public_key(key, pub_key)) == 0:
-                raise Exception("[OpenSSL] EC_KEY_set_public_key FAIL ... " + OpenSSL.get_error())
-            if (OpenSSL.EC_KEY_check_key(key)) == 0:
-                raise Exception("[OpenSSL] EC_KEY_check_key FAIL ... " + OpenSSL.get_error())
-
-            if not OpenSSL.using_openssl_1_1:
-                OpenSSL.EVP_MD_CTX_init(md_ctx)
-
-            OpenSSL.EVP_DigestInit_ex(md_ctx, OpenSSL.EVP_sha256(), None)
-
-            if (OpenSSL.EVP_DigestUpdate(md_ctx, buff, size)) == 0:
-                raise Exception("[OpenSSL] EVP_DigestUpdate FAIL ... " + OpenSSL.get_error())
-            OpenSSL.EVP_DigestFinal_ex(md_ctx, digest, dgst_len)
-            OpenSSL.ECDSA_sign(0, digest, dgst_len.contents, sig, siglen, key)
-            if (OpenSSL.ECDSA_verify(0, digest, dgst_len.contents, sig,
-                                     siglen.contents, key)) != 1:
-                raise Exception("[OpenSSL] ECDSA_verify FAIL ... " + OpenSSL.get_error())
-
-            return sig.raw[0:siglen.contents.value]
-
-        finally:
-            OpenSSL.EC_KEY_free(key)
-            OpenSSL.BN_free(pub_key_x)
-            OpenSSL.BN_free(pub_key_y)
-            OpenSSL.BN_free(priv_key)
-            OpenSSL.EC_POINT_free(pub_key)
-
-            if OpenSSL.using_openssl_1_1:
-                OpenSSL.EVP_MD_CTX_free(md_ctx)
-            else:
-                OpenSSL.EVP_MD_CTX_destroy(md_ctx)
+    def sign_digest(self, digest, check=True):
+        """
+        Sign an already computed digest (SHA-256 for signatures that
+        verify() accepts) and returns the signature. With check=False the
+        signature is not verified against the public key before returning
+        """
+        key = self._check_key()
+        digest, digest_len = OpenSSL.buffer(digest)
+        sig = OpenSSL.malloc(0, 151)
+        siglen = OpenSSL.pointer(OpenSSL.c_int(0))
+        if (OpenSSL.ECDSA_sign(0, digest, digest_len, sig, siglen, key)) != 1:
+            raise Exception("[OpenSSL] ECDSA_sign FAIL ... " + OpenSSL.get_error())
+        if check and (OpenSSL.ECDSA_verify(0, digest, digest_len, sig,
+                                           siglen.contents, key)) != 1:
+            raise Exception("[OpenSSL] ECDSA_verify FAIL ... " + OpenSSL.get_error())
+        return sig.raw[0:siglen.contents.value]
+
+    def signer(self, inputb=b""):
+        """
+        Returns a Signer that hashes the input in chunks, for messages
+        too large to hold in memory at once
+        """
+        return Signer(self, inputb)
 
     def verify(self, sig, inputb):
         """
         Verify the signature with the input and the local public key.
         Returns a boolean
         """
-        try:
-            bsig = OpenSSL.malloc(sig, len(sig))
-            binputb = OpenSSL.malloc(inputb, len(inputb))
-            digest = OpenSSL.malloc(0, 64)
-            dgst_len = OpenSSL.pointer(OpenSSL.c_int(0))
-
-            if OpenSSL.using_openssl_1_1:
-                md_ctx = OpenSSL.EVP_MD_CTX_new()
-            else:
-                md_ctx = OpenSSL.EVP_MD_CTX_create()
-                OpenSSL.EVP_MD_CTX_init(md_ctx)
-
-            key = OpenSSL.EC_KEY_new_by_curve_name(self.curve)
-
-            if key == 0:
-                raise Exception("[OpenSSL] EC_KEY_new_by_curve_name FAIL ... " + OpenSSL.get_error())
-
-            pub_key_x = OpenSSL.BN_bin2bn(self.pubkey_x, len(self.pubkey_x), 0)
-            pub_key_y = OpenSSL.BN_bin2bn(self.pubkey_y, len(self.pubkey_y), 0)
-            group = OpenSSL.EC_KEY_get0_group(key)
-            pub_key = OpenSSL.EC_POINT_new(group)
-
-            if (OpenSSL.EC_POINT_set_affine_coordinates_GFp(group, pub_key,
-                                                            pub_key_x,
-                                                            pub_key_y,
-                                                            0)) == 0:
-                raise Exception(
-                    "[OpenSSL] EC_POINT_set_affine_coordinates_GFp FAIL ... " + OpenSSL.get_error())
-            if (OpenSSL.EC_KEY_set_public_key(key, pub_key)) == 0:
-                raise Exception("[OpenSSL] EC_KEY_set_public_key FAIL ... " + OpenSSL.get_error())
-            if (OpenSSL.EC_KEY_check_key(key)) == 0:
-                raise Exception("[OpenSSL] EC_KEY_check_key FAIL ... " + OpenSSL.get_error())
-
-            OpenSSL.EVP_DigestInit_ex(md_ctx, OpenSSL.EVP_sha256(), None)
-            if (OpenSSL.EVP_DigestUpdate(md_ctx, binputb, len(inputb))) == 0:
-                raise Exception("[OpenSSL] EVP_DigestUpdate FAIL ... " + OpenSSL.get_error())
-
-            OpenSSL.EVP_DigestFinal_ex(md_ctx, digest, dgst_len)
-            ret = OpenSSL.ECDSA_verify(
-                0, digest, dgst_len.contents, bsig, len(sig), key)
+        return self.verify_many([(sig, inputb)])[0]
 
-            if ret == -1:
-                return False  # Fail to Check
-            else:
-                if ret == 0:
-                    return False  # Bad signature !
-                else:
-                    return True  # Good
-            return False
+    def verify_many(self, signatures):
+        """
+        Verify (signature, input) pairs against the local public key.
+        Returns a list of booleans
+        """
+        with self.verifier() as verifier:
+            return verifier.verify_many(signatures)
 
-        finally:
-            OpenSSL.EC_KEY_free(key)
-            OpenSSL.BN_free(pub_key_x)
-            OpenSSL.BN_free(pub_key_y)
-            OpenSSL.EC_POINT_free(pub_key)
+    def verify_digest(self, sig, digest):
+        """
+        Verify the signature of an already computed digest with the
+        local public key. Returns a boolean
+        """
+        return _verify_digest(self._check_key(), sig, digest)
 
-            if OpenSSL.using_openssl_1_1:
-                OpenSSL.EVP_MD_CTX_free(md_ctx)
-            else:
-                OpenSSL.EVP_MD_CTX_destroy(md_ctx)
+    def verifier(self):
+        """
+        Returns a Verifier bound to the local public key, for checking
+        many signatures with the same key and digest contexts
+        """
+        return Verifier(self)
 
     def encrypt(self, data, pubkey, ephemcurve=None, ciphername='aes-256-cbc'):
         """
         Encrypt data with ECIES method using the public key of the recipient.
+        With an AEAD ciphername (aes-256-gcm, chacha20-poly1305) the
+        cipher's tag replaces the HMAC-SHA256 and the data is read once.
         """
         curve = OpenSSL.get_curve_by_id(self.curve)
         pubkey_x, pubkey_y = ECC._decode_pubkey(pubkey)
@@ -631,6 +701,11 @@ class ECC:
         pubkey = ephem.get_pubkey()
         iv = Cipher.gen_IV(ciphername)
         ctx = Cipher(key_e, iv, 1, ciphername)
+        if ctx.cipher.is_aead():
+            # one pass: the tag covers the IV and ephemeral key as well
+            ctx.update_aad(iv + pubkey)
+            ciphertext = iv + pubkey + ctx.ciphering(data)
+            return ciphertext + ctx.get_tag()
         ciphertext = iv + pubkey + ctx.ciphering(data)
         mac = hmac_sha256(key_m, ciphertext)
         return ciphertext + mac
@@ -639,18 +714,286 @@ class ECC:
         """
         Decrypt data with ECIES method using the local private key
         """
-        blocksize = OpenSSL.get_cipher(ciphername).get_blocksize()
+        cipher = OpenSSL.get_cipher(ciphername)
+        blocksize = cipher.get_blocksize()
+        mac_len = TAG_SIZE if cipher.is_aead() else 32
         iv = data[:blocksize]
         i = blocksize
         coord_len = len(self.pubkey_x) * 2 + 1
         pubkey_x, pubkey_y = ECC._decode_pubkey(data[i:i + coord_len])
         i += coord_len
-        ciphertext = data[i:len(data) - 32]
-        i = len(data) - 32
+        ciphertext = data[i:len(data) - mac_len]
+        header_len = i
+        i = len(data) - mac_len
         mac = data[i:]
         key = sha512(self.raw_get_ecdh_key(pubkey_x, pubkey_y)).digest()
         key_e, key_m = key[:32], key[32:]
+        if cipher.is_aead():
+            ctx = Cipher(key_e, iv, 0, ciphername)
+            ctx.update_aad(data[:header_len])
+            ctx.set_tag(mac)
+            plaintext = ctx.update(ciphertext)
+            try:
+                return plaintext + ctx.final()
+            except Exception:
+                raise RuntimeError("Fail to verify data")
         if not equals(hmac_sha256(key_m, data[:i]), mac):
             raise RuntimeError("Fail to verify data")
         ctx = Cipher(key_e, iv, 0, ciphername)
         return ctx.ciphering(ciphertext)
+
+    def encrypt_stream(self, src, dst, pubkey, ciphername='aes-256-gcm',
+                       segment_size=1 << 16):
+        """
+        Encrypt the file object src into dst with streaming ECIES for the
+        public key of the recipient; see raw_encrypt_stream. Returns the
+        number of bytes written
+        """
+        curve = OpenSSL.get_curve_by_id(self.curve)
+        pubkey_x, pubkey_y = ECC._decode_pubkey(pubkey)
+        return ECC.raw_encrypt_stream(src, dst, pubkey_x, pubkey_y, curve=curve,
+                                      ciphername=ciphername,
+                                      segment_size=segment_size)
+
+    @staticmethod
+    def raw_encrypt_stream(src, dst, pubkey_x, pubkey_y, curve='sect283r1',
+                           ciphername='aes-256-gcm', segment_size=1 << 16):
+        """
+        Streaming ECIES with an AEAD cipher. The key is derived once, as
+        in raw_encrypt, and the message is cut in segments of
+        segment_size bytes, each encrypted and tagged on its own:
+
+            ephemeral pubkey | segment_size (u32) | segment + tag | ...
+
+        Segment nonces count up from 0 and mark the last segment, and
+        every tag also covers the header, so reordered, dropped or
+        truncated segments fail to decrypt. Memory stays at two segments
+        whatever the size of src.
+        """
+        if not OpenSSL.get_cipher(ciphername).is_aead():
+            raise Exception("[ECC] Streaming ECIES needs an AEAD cipher")
+        if not 0 < segment_size <= MAX_SEGMENT_SIZE:
+            raise Exception("[ECC] Unsupported segment size")
+        ephem = ECC(curve=curve)
+        key_e = sha512(ephem.raw_get_ecdh_key(pubkey_x, pubkey_y)).digest()[:32]
+        header = ephem.get_pubkey() + pack('!I', segment_size)
+        dst.write(header)
+        ctx = Cipher(key_e, _stream_nonce(0, 0), 1, ciphername)
+        out = bytearray(segment_size + TAG_SIZE)
+        outview = memoryview(out)
+        current, ahead = bytearray(segment_size), bytearray(segment_size)
+        size = _read_full(src, current)
+        total = len(header)
+        counter = 0
+        while True:
+            ahead_size = _read_full(src, ahead) if size == segment_size else 0
+            last = 0 == ahead_size
+            ctx.reset(None, _stream_nonce(counter, last))
+            ctx.update_aad(header)
+            n = ctx.update_into(memoryview(current)[:size], out)
+            n += ctx.final_into(outview[n:])
+            outview[n:n + TAG_SIZE] = ctx.get_tag()
+            dst.write(outview[:n + TAG_SIZE])
+            total += n + TAG_SIZE
+            if last:
+                return total
+            counter += 1
+            current, ahead, size = ahead, current, ahead_size
+
+    def decrypt_stream(self, src, dst, ciphername='aes-256-gcm',
+                       max_segment_size=MAX_SEGMENT_SIZE):
+        """
+        Decrypt streaming ECIES from the file object src into dst with the
+        local private key, one segment at a time. Segments are written
+        once their tag checks out; RuntimeError is raised on the first
+        one that does not, or if the stream ends before its last
+        segment. Streams whose header asks for segments larger than
+        max_segment_size are rejected before anything is allocated.
+        Returns the number of bytes written
+        """
+        coord_len = len(self.pubkey_x) * 2 + 1
+        header = bytearray(coord_len + 4)
+        if _read_full(src, header) != len(header):
+            raise RuntimeError("Fail to verify data")
+        header = bytes(header)
+        pubkey_x, pubkey_y = ECC._decode_pubkey(header[:coord_len])
+        segment_size = unpack('!I', header[coord_len:])[0]
+        if not 0 < segment_size <= max_segment_size:
+            raise RuntimeError("Fail to verify data")
+        key_e = sha512(self.raw_get_ecdh_key(pubkey_x, pubkey_y)).digest()[:32]
+        ctx = Cipher(key_e, _stream_nonce(0, 0), 0, ciphername)
+        out = bytearray(segment_size + ctx.block_size)
+        outview = memoryview(out)
+        chunk = segment_size + TAG_SIZE
+        current, ahead = bytearray(chunk), bytearray(chunk)
+        size = _read_full(src, current)
+        total = 0
+        counter = 0
+        while True:
+            if size < TAG_SIZE:
+                raise RuntimeError("Fail to verify data")
+            ahead_size = _read_full(src, ahead) if size == chunk else 0
+            last = 0 == ahead_size
+            view = memoryview(current)
+            ctx.reset(None, _stream_nonce(counter, last))
+            ctx.update_aad(header)
+            ctx.set_tag(bytes(view[size - TAG_SIZE:size]))
+            n = ctx.update_into(view[:size - TAG_SIZE], out)
+            try:
+                n += ctx.final_into(outview[n:])
+            except Exception:
+                raise RuntimeError("Fail to verify data")
+            dst.write(outview[:n])
+            total += n
+            if last:
+                return total
+            counter += 1
+            current, ahead, size = ahead, current, ahead_size
+
+
+def _stream_nonce(counter, last):
+    return pack('!QxxxB', counter, last)
+
+
+def _read_full(src, buf):
+    """
+    Fill buf from the file object src, across short reads; returns the
+    length read, less than len(buf) only at the end of src
+    """
+    view = memoryview(buf)
+    size = 0
+    while size < len(view):
+        if hasattr(src, 'readinto'):
+            n = src.readinto(view[size:])
+        else:
+            data = src.read(len(view) - size)
+            n = len(data)
+            view[size:size + n] = data
+        if not n:
+            break
+        size += n
+    return size
+
+
+def _verify_digest(key, sig, digest, digest_len=None):
+    if digest_len is None:
+        digest, digest_len = OpenSSL.buffer(digest)
+    sig, sig_len = OpenSSL.buffer(sig)
+    ret = OpenSSL.ECDSA_verify(0, digest, digest_len, sig, sig_len, key)
+    return ret == 1  # 0: bad signature, -1: fail to check
+
+
+class Signer:
+    """
+    Incremental ECDSA (SHA-256) signing with the private key of one ECC
+    object. Chunks passed to update() are hashed as they come, so the
+    message is never copied or held in memory as a whole.
+
+        signer = ECC(privkey=privkey, pubkey=pubkey).signer()
+        for chunk in chunks:
+            signer.update(chunk)
+        sig = signer.sign()
+    """
+
+    def __init__(self, ecc, inputb=b""):
+        self.ecc = ecc
+        self.hash = sha256(OpenSSL.buffer(inputb)[0])
+
+    def update(self, inputb):
+        self.hash.update(OpenSSL.buffer(inputb)[0])
+
+    def digest(self):
+        return self.hash.digest()
+
+    def sign(self, check=True):
+        """
+        Returns the signature of everything passed to update() so far
+        """
+        return self.ecc.sign_digest(self.hash.digest(), check)
+
+    def verify(self, sig):
+        """
+        Returns True if sig is a valid signature of everything passed to
+        update() so far
+        """
+        return self.ecc.verify_digest(sig, self.hash.digest())
+
+
+class Verifier:
+    """
+    ECDSA (SHA-256) verification against the public key of one ECC
+    object. The EC_KEY, checked once, and an EVP_MD_CTX are reused for
+    every signature until close(); not safe to share between threads.
+    The Verifier holds its own reference to the EC_KEY, so it keeps
+    working after the ECC object is closed or given another key.
+
+        with ECC(pubkey=pubkey).verifier() as verifier:
+            results = verifier.verify_many(records)
+    """
+
+    def __init__(self, ecc):
+        self.md_ctx = None
+        self.key = ecc._check_key()
+        if (OpenSSL.EC_KEY_up_ref(self.key)) != 1:
+            self.key = None
+            raise Exception("[OpenSSL] EC_KEY_up_ref FAIL ... " + OpenSSL.get_error())
+        self.md = OpenSSL.EVP_sha256()
+        self.digest = OpenSSL.malloc(0, 64)
+        self.dgst_len = OpenSSL.pointer(OpenSSL.c_int(0))
+        if OpenSSL.using_openssl_1_1:
+            self.md_ctx = OpenSSL.EVP_MD_CTX_new()
+        else:
+            self.md_ctx = OpenSSL.EVP_MD_CTX_create()
+            OpenSSL.EVP_MD_CTX_init(self.md_ctx)
+        if not self.md_ctx:
+            raise Exception("[OpenSSL] EVP_MD_CTX_new FAIL ... " + OpenSSL.get_error())
+
+    def verify(self, sig, inputb):
+        """
+        Returns True if sig is a valid signature of inputb
+        """
+        if self.md_ctx is None:
+            raise Exception("[Verifier] closed")
+        if (OpenSSL.EVP_DigestInit_ex(self.md_ctx, self.md, None)) == 0:
+            raise Exception("[OpenSSL] EVP_DigestInit_ex FAIL ... " + OpenSSL.get_error())
+        inp, size = OpenSSL.buffer(inputb)
+        if (OpenSSL.EVP_DigestUpdate(self.md_ctx, inp, size)) == 0:
+            raise Exception("[OpenSSL] EVP_DigestUpdate FAIL ... " + OpenSSL.get_error())
+        if (OpenSSL.EVP_DigestFinal_ex(self.md_ctx, self.digest, self.dgst_len)) == 0:
+            raise Exception("[OpenSSL] EVP_DigestFinal_ex FAIL ... " + OpenSSL.get_error())
+        return _verify_digest(self.key, sig, self.digest, self.dgst_len.contents)
+
+    def verify_digest(self, sig, digest):
+        """
+        Returns True if sig is a valid signature of the digest
+        """
+        return _verify_digest(self.key, sig, digest)
+
+    def verify_many(self, signatures):
+        """
+        Verify (signature, input) pairs; returns a list of booleans
+        """
+        return [self.verify(sig, inputb) for sig, inputb in signatures]
+
+    def close(self):
+        if self.md_ctx is not None:
+            if OpenSSL.using_openssl_1_1:
+                OpenSSL.EVP_MD_CTX_free(self.md_ctx)
+            else:
+                OpenSSL.EVP_MD_CTX_destroy(self.md_ctx)
+            self.md_ctx = None
+        if self.key is not None:
+            OpenSSL.EC_KEY_free(self.key)
+            self.key = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass  # OpenSSL may already be gone at interpreter exit
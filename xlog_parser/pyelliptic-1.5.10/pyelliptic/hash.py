@@ -29,8 +29,17 @@
 # OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN
 # IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import hashlib
+import hmac
+
 from .openssl import OpenSSL
 
+# digestmod -> (EVP_MD getter name, digest size)
+_DIGESTS = {
+    'sha256': ('EVP_sha256', 32),
+    'sha512': ('EVP_sha512', 64),
+}
+
 
 # For python3
 def _equals_bytes(a, b):
@@ -58,37 +67,111 @@ def equals(a, b):
         return _equals_bytes(a, b)
 
 
+def _encode(data):
+    return data.encode() if isinstance(data, str) else data
+
+
 def hmac_sha256(k, m):
     """
     Compute the key and the message with HMAC SHA5256
     """
-    key = OpenSSL.malloc(k, len(k))
-    d = OpenSSL.malloc(m, len(m))
-    md = OpenSSL.malloc(0, 32)
-    i = OpenSSL.pointer(OpenSSL.c_int(0))
-    OpenSSL.HMAC(OpenSSL.EVP_sha256(), key, len(k), d, len(m), md, i)
-    return md.raw
+    return hmac.new(_encode(k), _encode(m), hashlib.sha256).digest()
 
 
 def hmac_sha512(k, m):
     """
     Compute the key and the message with HMAC SHA512
     """
-    key = OpenSSL.malloc(k, len(k))
-    d = OpenSSL.malloc(m, len(m))
-    md = OpenSSL.malloc(0, 64)
-    i = OpenSSL.pointer(OpenSSL.c_int(0))
-    OpenSSL.HMAC(OpenSSL.EVP_sha512(), key, len(k), d, len(m), md, i)
-    return md.raw
+    return hmac.new(_encode(k), _encode(m), hashlib.sha512).digest()
+
+
+def new(key, msg=None, digestmod='sha256', backend='hashlib'):
+    """
+    Returns an incremental HMAC object with update(), digest(),
+    hexdigest() and copy(). copy() keeps the keyed state, so MACs of many
+    messages under one key can start from a copy instead of setting the
+    key up again:
+
+        template = pyelliptic.hash.new(key)
+        for message in messages:
+            mac = template.copy()
+            mac.update(message)
+            tag = mac.digest()
+
+    backend='hashlib' returns the standard library hmac object, which
+    runs on the interpreter's OpenSSL and is the faster of the two (see
+    bench_hmac.py); backend='openssl' returns an HMAC driving this
+    library's libcrypto through ctypes.
+    """
+    if backend == 'hashlib':
+        return hmac.new(_encode(key), _encode(msg), digestmod)
+    elif backend == 'openssl':
+        return HMAC(key, msg, digestmod)
+    raise Exception("[HMAC] Unsupported backend %r" % (backend,))
+
+
+class HMAC:
+    """
+    Incremental HMAC on a libcrypto HMAC_CTX (OpenSSL 1.1 or later)
+    """
+    def __init__(self, key, msg=None, digestmod='sha256'):
+        if digestmod not in _DIGESTS:
+            raise Exception("[HMAC] Unsupported digest %r" % (digestmod,))
+        md, self.digest_size = _DIGESTS[digestmod]
+        self.name = 'hmac-' + digestmod
+        self.ctx = OpenSSL.HMAC_CTX_new()
+        self._final_ctx = None
+        k, key_len = OpenSSL.buffer(key)
+        if OpenSSL.HMAC_Init_ex(self.ctx, k, key_len, getattr(OpenSSL, md)(), None) != 1:
+            raise Exception("[OpenSSL] HMAC_Init_ex FAIL ... " + OpenSSL.get_error())
+        if msg is not None:
+            self.update(msg)
+
+    def update(self, msg):
+        d, size = OpenSSL.buffer(msg)
+        if OpenSSL.HMAC_Update(self.ctx, d, size) != 1:
+            raise Exception("[OpenSSL] HMAC_Update FAIL ... " + OpenSSL.get_error())
+
+    def copy(self):
+        other = HMAC.__new__(HMAC)
+        other.digest_size = self.digest_size
+        other.name = self.name
+        other.ctx = OpenSSL.HMAC_CTX_new()
+        other._final_ctx = None
+        if OpenSSL.HMAC_CTX_copy(other.ctx, self.ctx) != 1:
+            raise Exception("[OpenSSL] HMAC_CTX_copy FAIL ... " + OpenSSL.get_error())
+        return other
+
+    def digest(self):
+        """
+        MAC of everything passed to update() so far; more can follow
+        """
+        if self._final_ctx is None:
+            self._final_ctx = OpenSSL.HMAC_CTX_new()
+        if OpenSSL.HMAC_CTX_copy(self._final_ctx, self.ctx) != 1:
+            raise Exception("[OpenSSL] HMAC_CTX_copy FAIL ... " + OpenSSL.get_error())
+        md = OpenSSL.malloc(0, self.digest_size)
+        if OpenSSL.HMAC_Final(self._final_ctx, md, None) != 1:
+            raise Exception("[OpenSSL] HMAC_Final FAIL ... " + OpenSSL.get_error())
+        return md.raw
+
+    def hexdigest(self):
+        return self.digest().hex()
+
+    def __del__(self):
+        if getattr(self, 'ctx', None):
+            OpenSSL.HMAC_CTX_free(self.ctx)
+        if getattr(self, '_final_ctx', None):
+            OpenSSL.HMAC_CTX_free(self._final_ctx)
 
 
 def pbkdf2(password, salt=None, i=10000, keylen=64):
     if salt is None:
         salt = OpenSSL.rand(8)
-    p_password = OpenSSL.malloc(password, len(password))
-    p_salt = OpenSSL.malloc(salt, len(salt))
+    p_password, password_len = OpenSSL.buffer(password)
+    p_salt, salt_len = OpenSSL.buffer(salt)
     output = OpenSSL.malloc(0, keylen)
-    OpenSSL.PKCS5_PBKDF2_HMAC(p_password, len(password), p_salt,
-                              len(p_salt), i, OpenSSL.EVP_sha256(),
+    OpenSSL.PKCS5_PBKDF2_HMAC(p_password, password_len, p_salt,
+                              salt_len, i, OpenSSL.EVP_sha256(),
                               keylen, output)
     return salt, output.raw
@@ -30,7 +30,6 @@
 # IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import ctypes
-import ctypes.util
 import sys
 
 
@@ -40,6 +39,7 @@ def find_crypto_lib():
         # return ctypes.util.find_library('crypto')
         return '/usr/lib/libcrypto.dylib'
 
+    import ctypes.util
     lib_names = [
         'libcrypto-1_1.dll',
         'libcrypto.dll',
@@ -99,10 +99,11 @@ def parse_SSLeay_version(version):
 
 
 class CipherName:
-    def __init__(self, name, pointer, blocksize):
+    def __init__(self, name, pointer, blocksize, aead=False):
         self._name = name
         self._pointer = pointer
         self._blocksize = blocksize
+        self._aead = aead
 
     def __str__(self):
         return ("Cipher : %s | Blocksize : %s | Function pointer : %s" %
@@ -117,6 +118,140 @@ class CipherName:
     def get_blocksize(self):
         return self._blocksize
 
+    def is_aead(self):
+        return self._aead
+
+
+# libcrypto functions as name: (restype, argtypes). _OpenSSL binds each one
+# the first time it is used, so importing pyelliptic only loads the library.
+_FUNCTIONS = {
+    'ERR_error_string': (ctypes.c_char_p, [ctypes.c_ulong, ctypes.c_char_p]),
+    'ERR_get_error': (ctypes.c_ulong, []),
+
+    'BN_new': (ctypes.c_void_p, []),
+    'BN_free': (None, [ctypes.c_void_p]),
+    'BN_num_bits': (ctypes.c_int, [ctypes.c_void_p]),
+    'BN_bn2bin': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p]),
+    'BN_bin2bn': (ctypes.c_void_p, [ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p]),
+    'BN_CTX_new': (ctypes.c_void_p, []),
+    'BN_CTX_end': (None, [ctypes.c_void_p]),
+    'BN_CTX_free': (None, [ctypes.c_void_p]),
+    'BN_CTX_start': (None, [ctypes.c_void_p]),
+    'BN_CTX_get': (ctypes.c_void_p, [ctypes.c_void_p]),
+
+    'EC_GROUP_get_degree': (ctypes.c_int, [ctypes.c_void_p]),
+    'EC_GROUP_method_of': (ctypes.c_void_p, [ctypes.c_void_p]),
+    'EC_GROUP_get_cofactor': (ctypes.c_int, 3 * [ctypes.c_void_p]),
+    'EC_METHOD_get_field_type': (ctypes.c_int, [ctypes.c_void_p]),
+
+    'EC_KEY_free': (None, [ctypes.c_void_p]),
+    'EC_KEY_up_ref': (ctypes.c_int, [ctypes.c_void_p]),
+    'EC_KEY_new_by_curve_name': (ctypes.c_void_p, [ctypes.c_int]),
+    'EC_KEY_generate_key': (ctypes.c_int, [ctypes.c_void_p]),
+    'EC_KEY_check_key': (ctypes.c_int, [ctypes.c_void_p]),
+    'EC_KEY_get0_private_key': (ctypes.c_void_p, [ctypes.c_void_p]),
+    'EC_KEY_get0_public_key': (ctypes.c_void_p, [ctypes.c_void_p]),
+    'EC_KEY_get0_group': (ctypes.c_void_p, [ctypes.c_void_p]),
+    'EC_KEY_set_private_key': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p]),
+    'EC_KEY_set_public_key': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p]),
+    'EC_KEY_set_group': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p]),
+    'EC_KEY_set_method': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p]),
+
+    'EC_POINT_new': (ctypes.c_void_p, [ctypes.c_void_p]),
+    'EC_POINT_free': (None, [ctypes.c_void_p]),
+    'EC_POINT_get_affine_coordinates_GFp': (ctypes.c_int, 5 * [ctypes.c_void_p]),
+    'EC_POINT_set_affine_coordinates_GFp': (ctypes.c_int, 5 * [ctypes.c_void_p]),
+    'EC_POINT_get_affine_coordinates_GF2m': (ctypes.c_int, 5 * [ctypes.c_void_p]),
+    'EC_POINT_mul': (ctypes.c_int, 6 * [ctypes.c_void_p]),
+    'EC_POINT_is_on_curve': (ctypes.c_int, 3 * [ctypes.c_void_p]),
+
+    # OpenSSL < 1.1
+    'ECDH_OpenSSL': (ctypes.c_void_p, []),
+    'ECDH_set_method': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p]),
+    'ECDH_compute_key': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p]),
+
+    'EVP_CipherInit_ex': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]),
+    'EVP_CIPHER_CTX_new': (ctypes.c_void_p, []),
+    'EVP_CIPHER_CTX_reset': (ctypes.c_int, [ctypes.c_void_p]),
+    'EVP_CIPHER_CTX_cleanup': (ctypes.c_int, [ctypes.c_void_p]),
+    'EVP_CIPHER_CTX_free': (None, [ctypes.c_void_p]),
+    'EVP_CIPHER_CTX_ctrl': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_void_p]),
+    'EVP_CipherUpdate': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p,
+                                        ctypes.c_int]),
+    'EVP_CipherFinal_ex': (ctypes.c_int, 3 * [ctypes.c_void_p]),
+    'EVP_CIPHER_block_size': (ctypes.c_int, [ctypes.c_void_p]),
+
+    # Cipher
+    'EVP_aes_128_cfb128': (ctypes.c_void_p, []),
+    'EVP_aes_256_cfb128': (ctypes.c_void_p, []),
+    'EVP_aes_128_cbc': (ctypes.c_void_p, []),
+    'EVP_aes_256_cbc': (ctypes.c_void_p, []),
+    'EVP_aes_128_ctr': (ctypes.c_void_p, []),
+    'EVP_aes_256_ctr': (ctypes.c_void_p, []),
+    'EVP_aes_128_gcm': (ctypes.c_void_p, []),
+    'EVP_aes_256_gcm': (ctypes.c_void_p, []),
+    'EVP_chacha20_poly1305': (ctypes.c_void_p, []),
+    'EVP_aes_128_ofb': (ctypes.c_void_p, []),
+    'EVP_aes_256_ofb': (ctypes.c_void_p, []),
+    'EVP_bf_cbc': (ctypes.c_void_p, []),
+    'EVP_bf_cfb64': (ctypes.c_void_p, []),
+    'EVP_rc4': (ctypes.c_void_p, []),
+
+    'EVP_DigestInit': (ctypes.c_int, 2 * [ctypes.c_void_p]),
+    'EVP_DigestInit_ex': (ctypes.c_int, 3 * [ctypes.c_void_p]),
+    'EVP_DigestUpdate': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int]),
+    'EVP_DigestFinal': (ctypes.c_int, 3 * [ctypes.c_void_p]),
+    'EVP_DigestFinal_ex': (ctypes.c_int, 3 * [ctypes.c_void_p]),
+    'EVP_ecdsa': (ctypes.c_void_p, []),
+
+    'ECDSA_sign': (ctypes.c_int, [ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p,
+                                  ctypes.c_void_p]),
+    'ECDSA_verify': (ctypes.c_int, [ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_int,
+                                    ctypes.c_void_p]),
+
+    # OpenSSL >= 1.1
+    'EVP_MD_CTX_new': (ctypes.c_void_p, []),
+    'EVP_MD_CTX_free': (None, [ctypes.c_void_p]),
+    # OpenSSL < 1.1
+    'EVP_MD_CTX_create': (ctypes.c_void_p, []),
+    'EVP_MD_CTX_init': (None, [ctypes.c_void_p]),
+    'EVP_MD_CTX_destroy': (None, [ctypes.c_void_p]),
+
+    'RAND_bytes': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_int]),
+    'EVP_sha256': (ctypes.c_void_p, []),
+    'EVP_sha512': (ctypes.c_void_p, []),
+    'i2o_ECPublicKey': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p]),
+    'HMAC': (ctypes.c_void_p, [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_int,
+                               ctypes.c_void_p, ctypes.c_void_p]),
+    'HMAC_CTX_new': (ctypes.c_void_p, []),
+    'HMAC_CTX_free': (None, [ctypes.c_void_p]),
+    'HMAC_CTX_copy': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p]),
+    'HMAC_Init_ex': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p,
+                                    ctypes.c_void_p]),
+    'HMAC_Update': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t]),
+    'HMAC_Final': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]),
+    'PKCS5_PBKDF2_HMAC': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_int,
+                                         ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p]),
+}
+
+# EVP_CIPHER_CTX_ctrl commands for AEAD ciphers
+EVP_CTRL_AEAD_SET_IVLEN = 0x9
+EVP_CTRL_AEAD_GET_TAG = 0x10
+EVP_CTRL_AEAD_SET_TAG = 0x11
+
+# looked up under the second name when the library lacks the first
+# (PKCS5_PBKDF2_HMAC is not exported by all versions of OSX, OpenSSL 3.0
+# renamed the EVP_CIPHER getters)
+_FALLBACKS = {
+    'PKCS5_PBKDF2_HMAC': 'PKCS5_PBKDF2_HMAC_SHA1',
+    'EVP_CIPHER_block_size': 'EVP_CIPHER_get_block_size',  # OpenSSL 3.0
+}
+
+# missing from some builds; these read as None instead of raising AttributeError
+_OPTIONAL = (
+    'EC_POINT_get_affine_coordinates_GF2m',
+)
+
 
 class _OpenSSL:
     """
@@ -139,358 +274,40 @@ class _OpenSSL:
         self.pointer = ctypes.pointer
         self.memset = ctypes.memset
         self.memmove = ctypes.memmove
+        self.string_at = ctypes.string_at
 
         self.c_int = ctypes.c_int
         self.byref = ctypes.byref
         self.create_string_buffer = ctypes.create_string_buffer
 
-        self.ERR_error_string = self._lib.ERR_error_string
-        self.ERR_error_string.restype = ctypes.c_char_p
-        self.ERR_error_string.argtypes = [ctypes.c_ulong, ctypes.c_char_p]
-
-        self.ERR_get_error = self._lib.ERR_get_error
-        self.ERR_get_error.restype = ctypes.c_ulong
-        self.ERR_get_error.argtypes = []
-
-        self.BN_new = self._lib.BN_new
-        self.BN_new.restype = ctypes.c_void_p
-        self.BN_new.argtypes = []
-
-        self.BN_free = self._lib.BN_free
-        self.BN_free.restype = None
-        self.BN_free.argtypes = [ctypes.c_void_p]
-
-        self.BN_num_bits = self._lib.BN_num_bits
-        self.BN_num_bits.restype = ctypes.c_int
-        self.BN_num_bits.argtypes = [ctypes.c_void_p]
-
-        self.BN_bn2bin = self._lib.BN_bn2bin
-        self.BN_bn2bin.restype = ctypes.c_int
-        self.BN_bn2bin.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
-
-        self.BN_bin2bn = self._lib.BN_bin2bn
-        self.BN_bin2bn.restype = ctypes.c_void_p
-        self.BN_bin2bn.argtypes = [ctypes.c_void_p, ctypes.c_int,
-                                   ctypes.c_void_p]
-
-        self.EC_GROUP_get_degree = self._lib.EC_GROUP_get_degree
-        self.EC_GROUP_get_degree.restype = ctypes.c_int
-        self.EC_GROUP_get_degree.argtypes = [ctypes.c_void_p]
-
-        self.EC_GROUP_method_of = self._lib.EC_GROUP_method_of
-        self.EC_GROUP_method_of.restype = ctypes.c_void_p
-        self.EC_GROUP_method_of.argtypes = [ctypes.c_void_p]
-
-        self.EC_KEY_free = self._lib.EC_KEY_free
-        self.EC_KEY_free.restype = None
-        self.EC_KEY_free.argtypes = [ctypes.c_void_p]
-
-        self.EC_KEY_new_by_curve_name = self._lib.EC_KEY_new_by_curve_name
-        self.EC_KEY_new_by_curve_name.restype = ctypes.c_void_p
-        self.EC_KEY_new_by_curve_name.argtypes = [ctypes.c_int]
-
-        self.EC_KEY_generate_key = self._lib.EC_KEY_generate_key
-        self.EC_KEY_generate_key.restype = ctypes.c_int
-        self.EC_KEY_generate_key.argtypes = [ctypes.c_void_p]
-
-        self.EC_KEY_check_key = self._lib.EC_KEY_check_key
-        self.EC_KEY_check_key.restype = ctypes.c_int
-        self.EC_KEY_check_key.argtypes = [ctypes.c_void_p]
-
-        self.EC_KEY_get0_private_key = self._lib.EC_KEY_get0_private_key
-        self.EC_KEY_get0_private_key.restype = ctypes.c_void_p
-        self.EC_KEY_get0_private_key.argtypes = [ctypes.c_void_p]
-
-        self.EC_KEY_get0_public_key = self._lib.EC_KEY_get0_public_key
-        self.EC_KEY_get0_public_key.restype = ctypes.c_void_p
-        self.EC_KEY_get0_public_key.argtypes = [ctypes.c_void_p]
-
-        self.EC_KEY_get0_group = self._lib.EC_KEY_get0_group
-        self.EC_KEY_get0_group.restype = ctypes.c_void_p
-        self.EC_KEY_get0_group.argtypes = [ctypes.c_void_p]
-
-        self.EC_KEY_set_private_key = self._lib.EC_KEY_set_private_key
-        self.EC_KEY_set_private_key.restype = ctypes.c_int
-        self.EC_KEY_set_private_key.argtypes = [ctypes.c_void_p,
-                                                ctypes.c_void_p]
-
-        self.EC_KEY_set_public_key = self._lib.EC_KEY_set_public_key
-        self.EC_KEY_set_public_key.restype = ctypes.c_int
-        self.EC_KEY_set_public_key.argtypes = [ctypes.c_void_p,
-                                               ctypes.c_void_p]
-
-        self.EC_KEY_set_group = self._lib.EC_KEY_set_group
-        self.EC_KEY_set_group.restype = ctypes.c_int
-        self.EC_KEY_set_group.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
-
-        self.EC_POINT_new = self._lib.EC_POINT_new
-        self.EC_POINT_new.restype = ctypes.c_void_p
-        self.EC_POINT_new.argtypes = [ctypes.c_void_p]
-
-        self.EC_POINT_free = self._lib.EC_POINT_free
-        self.EC_POINT_free.restype = None
-        self.EC_POINT_free.argtypes = [ctypes.c_void_p]
-
-        self.EC_POINT_get_affine_coordinates_GFp = self._lib.EC_POINT_get_affine_coordinates_GFp
-        self.EC_POINT_get_affine_coordinates_GFp.restype = ctypes.c_int
-        self.EC_POINT_get_affine_coordinates_GFp.argtypes = 5 * [ctypes.c_void_p]
-
-        self.EC_POINT_set_affine_coordinates_GFp = self._lib.EC_POINT_set_affine_coordinates_GFp
-        self.EC_POINT_set_affine_coordinates_GFp.restype = ctypes.c_int
-        self.EC_POINT_set_affine_coordinates_GFp.argtypes = 5 * [ctypes.c_void_p]
-
-        try:
-            self.EC_POINT_get_affine_coordinates_GF2m = self._lib.EC_POINT_get_affine_coordinates_GF2m
-            self.EC_POINT_get_affine_coordinates_GF2m.restype = ctypes.c_int
-            self.EC_POINT_get_affine_coordinates_GF2m.argtypes = 5 * [ctypes.c_void_p]
-        except AttributeError:
-            self.EC_POINT_get_affine_coordinates_GF2m = None
-
-        self.EC_METHOD_get_field_type = self._lib.EC_METHOD_get_field_type
-        self.EC_METHOD_get_field_type.restype = ctypes.c_int
-        self.EC_METHOD_get_field_type.argtypes = [ctypes.c_void_p]
-
-        self.BN_CTX_new = self._lib.BN_CTX_new
-        self.BN_CTX_new.restype = ctypes.c_void_p
-        self.BN_CTX_new.argtypes = []
-
-        self.BN_CTX_end = self._lib.BN_CTX_end
-        self.BN_CTX_end.restype = ctypes.c_void_p
-        self.BN_CTX_end.argtypes = []
-
-        self.BN_CTX_free = self._lib.BN_CTX_free
-        self.BN_CTX_free.restype = None
-        self.BN_CTX_free.argtypes = [ctypes.c_void_p]
-
-        self.BN_CTX_start = self._lib.BN_CTX_start
-        self.BN_CTX_start.restype = None
-        self.BN_CTX_start.argtypes = [ctypes.c_void_p]
-
-        self.BN_CTX_get = self._lib.BN_CTX_get
-        self.BN_CTX_get.restype = ctypes.c_void_p
-        self.BN_CTX_get.argtypes = [ctypes.c_void_p]
-
-        self.EC_POINT_mul = self._lib.EC_POINT_mul
-        self.EC_POINT_mul.restype = ctypes.c_int
-        self.EC_POINT_mul.argtypes = [ctypes.c_void_p, ctypes.c_void_p,
-                                      ctypes.c_void_p, ctypes.c_void_p,
-                                      ctypes.c_void_p, ctypes.c_void_p]
-
-        self.EC_KEY_set_private_key = self._lib.EC_KEY_set_private_key
-        self.EC_KEY_set_private_key.restype = ctypes.c_int
-        self.EC_KEY_set_private_key.argtypes = [ctypes.c_void_p,
-                                                ctypes.c_void_p]
-
-        if self.using_openssl_1_1:
-            self.EC_KEY_set_method = self._lib.EC_KEY_set_method
-            self.EC_KEY_set_method.restype = ctypes.c_int
-            self.EC_KEY_set_method.argtypes = [ctypes.c_void_p,
-                                               ctypes.c_void_p]
-        else:
-            self.ECDH_OpenSSL = self._lib.ECDH_OpenSSL
-            self.ECDH_OpenSSL.restype = ctypes.c_void_p
-            self.ECDH_OpenSSL.argtypes = []
-
-            self.ECDH_set_method = self._lib.ECDH_set_method
-            self.ECDH_set_method.restype = ctypes.c_int
-            self.ECDH_set_method.argtypes = [ctypes.c_void_p,
-                                            ctypes.c_void_p]
-
-        self.ECDH_compute_key = self._lib.ECDH_compute_key
-        self.ECDH_compute_key.restype = ctypes.c_int
-        self.ECDH_compute_key.argtypes = [ctypes.c_void_p,
-                                          ctypes.c_int,
-                                          ctypes.c_void_p,
-                                          ctypes.c_void_p]
-
-        self.EVP_CipherInit_ex = self._lib.EVP_CipherInit_ex
-        self.EVP_CipherInit_ex.restype = ctypes.c_int
-        self.EVP_CipherInit_ex.argtypes = [ctypes.c_void_p,
-                                           ctypes.c_void_p, ctypes.c_void_p]
-
-        self.EVP_CIPHER_CTX_new = self._lib.EVP_CIPHER_CTX_new
-        self.EVP_CIPHER_CTX_new.restype = ctypes.c_void_p
-        self.EVP_CIPHER_CTX_new.argtypes = []
-
-        # Cipher
-        self.EVP_aes_128_cfb128 = self._lib.EVP_aes_128_cfb128
-        self.EVP_aes_128_cfb128.restype = ctypes.c_void_p
-        self.EVP_aes_128_cfb128.argtypes = []
-
-        self.EVP_aes_256_cfb128 = self._lib.EVP_aes_256_cfb128
-        self.EVP_aes_256_cfb128.restype = ctypes.c_void_p
-        self.EVP_aes_256_cfb128.argtypes = []
-
-        self.EVP_aes_128_cbc = self._lib.EVP_aes_128_cbc
-        self.EVP_aes_128_cbc.restype = ctypes.c_void_p
-        self.EVP_aes_128_cbc.argtypes = []
-
-        self.EVP_aes_256_cbc = self._lib.EVP_aes_256_cbc
-        self.EVP_aes_256_cbc.restype = ctypes.c_void_p
-        self.EVP_aes_256_cbc.argtypes = []
-
-        try:
-            self.EVP_aes_128_ctr = self._lib.EVP_aes_128_ctr
-            self.EVP_aes_128_ctr.restype = ctypes.c_void_p
-            self.EVP_aes_128_ctr.argtypes = []
-        except AttributeError:
-            pass
+    def __getattr__(self, name):
+        """
+        Called only for attributes not set yet: binds libcrypto functions
+        listed in _FUNCTIONS and builds the cipher and curve tables on
+        first use, then keeps them as plain attributes.
+        """
+        if name == 'cipher_algo':
+            self._set_ciphers()
+            return self.cipher_algo
+        if name == 'curves':
+            self._set_curves()
+            return self.curves
+        if name not in _FUNCTIONS or name.startswith('_'):
+            raise AttributeError(name)
 
         try:
-            self.EVP_aes_256_ctr = self._lib.EVP_aes_256_ctr
-            self.EVP_aes_256_ctr.restype = ctypes.c_void_p
-            self.EVP_aes_256_ctr.argtypes = []
+            func = getattr(self._lib, name)
         except AttributeError:
-            pass
-
-        self.EVP_aes_128_ofb = self._lib.EVP_aes_128_ofb
-        self.EVP_aes_128_ofb.restype = ctypes.c_void_p
-        self.EVP_aes_128_ofb.argtypes = []
-
-        self.EVP_aes_256_ofb = self._lib.EVP_aes_256_ofb
-        self.EVP_aes_256_ofb.restype = ctypes.c_void_p
-        self.EVP_aes_256_ofb.argtypes = []
-
-        self.EVP_bf_cbc = self._lib.EVP_bf_cbc
-        self.EVP_bf_cbc.restype = ctypes.c_void_p
-        self.EVP_bf_cbc.argtypes = []
-
-        self.EVP_bf_cfb64 = self._lib.EVP_bf_cfb64
-        self.EVP_bf_cfb64.restype = ctypes.c_void_p
-        self.EVP_bf_cfb64.argtypes = []
-
-        self.EVP_rc4 = self._lib.EVP_rc4
-        self.EVP_rc4.restype = ctypes.c_void_p
-        self.EVP_rc4.argtypes = []
-
-        if self.using_openssl_1_1:
-            self.EVP_CIPHER_CTX_reset = self._lib.EVP_CIPHER_CTX_reset
-            self.EVP_CIPHER_CTX_reset.restype = ctypes.c_int
-            self.EVP_CIPHER_CTX_reset.argtypes = [ctypes.c_void_p]
-        else:
-            self.EVP_CIPHER_CTX_cleanup = self._lib.EVP_CIPHER_CTX_cleanup
-            self.EVP_CIPHER_CTX_cleanup.restype = ctypes.c_int
-            self.EVP_CIPHER_CTX_cleanup.argtypes = [ctypes.c_void_p]
-
-        self.EVP_CIPHER_CTX_free = self._lib.EVP_CIPHER_CTX_free
-        self.EVP_CIPHER_CTX_free.restype = None
-        self.EVP_CIPHER_CTX_free.argtypes = [ctypes.c_void_p]
-
-        self.EVP_CipherUpdate = self._lib.EVP_CipherUpdate
-        self.EVP_CipherUpdate.restype = ctypes.c_int
-        self.EVP_CipherUpdate.argtypes = [ctypes.c_void_p,
-                                          ctypes.c_void_p,
-                                          ctypes.c_void_p,
-                                          ctypes.c_void_p,
-                                          ctypes.c_int]
-
-        self.EVP_CipherFinal_ex = self._lib.EVP_CipherFinal_ex
-        self.EVP_CipherFinal_ex.restype = ctypes.c_int
-        self.EVP_CipherFinal_ex.argtypes = 3 * [ctypes.c_void_p]
-
-        self.EVP_DigestInit = self._lib.EVP_DigestInit
-        self.EVP_DigestInit.restype = ctypes.c_int
-        self._lib.EVP_DigestInit.argtypes = 2 * [ctypes.c_void_p]
-
-        self.EVP_DigestInit_ex = self._lib.EVP_DigestInit_ex
-        self.EVP_DigestInit_ex.restype = ctypes.c_int
-        self._lib.EVP_DigestInit_ex.argtypes = 3 * [ctypes.c_void_p]
-
-        self.EVP_DigestUpdate = self._lib.EVP_DigestUpdate
-        self.EVP_DigestUpdate.restype = ctypes.c_int
-        self.EVP_DigestUpdate.argtypes = [ctypes.c_void_p,
-                                          ctypes.c_void_p,
-                                          ctypes.c_int]
-
-        self.EVP_DigestFinal = self._lib.EVP_DigestFinal
-        self.EVP_DigestFinal.restype = ctypes.c_int
-        self.EVP_DigestFinal.argtypes = [ctypes.c_void_p,
-                                         ctypes.c_void_p, ctypes.c_void_p]
-
-        self.EVP_DigestFinal_ex = self._lib.EVP_DigestFinal_ex
-        self.EVP_DigestFinal_ex.restype = ctypes.c_int
-        self.EVP_DigestFinal_ex.argtypes = [ctypes.c_void_p,
-                                            ctypes.c_void_p, ctypes.c_void_p]
-
-        if not self.using_openssl_1_1:
-            self.EVP_ecdsa = self._lib.EVP_ecdsa
-            self._lib.EVP_ecdsa.restype = ctypes.c_void_p
-            self._lib.EVP_ecdsa.argtypes = []
-
-        self.ECDSA_sign = self._lib.ECDSA_sign
-        self.ECDSA_sign.restype = ctypes.c_int
-        self.ECDSA_sign.argtypes = [ctypes.c_int,
-                                    ctypes.c_void_p,
-                                    ctypes.c_int,
-                                    ctypes.c_void_p,
-                                    ctypes.c_void_p,
-                                    ctypes.c_void_p]
-
-        self.ECDSA_verify = self._lib.ECDSA_verify
-        self.ECDSA_verify.restype = ctypes.c_int
-        self.ECDSA_verify.argtypes = [ctypes.c_int,
-                                      ctypes.c_void_p,
-                                      ctypes.c_int,
-                                      ctypes.c_void_p,
-                                      ctypes.c_int,
-                                      ctypes.c_void_p]
-
-        if self.using_openssl_1_1:
-            self.EVP_MD_CTX_new = self._lib.EVP_MD_CTX_new
-            self.EVP_MD_CTX_new.restype = ctypes.c_void_p
-            self.EVP_MD_CTX_new.argtypes = []
-
-            self.EVP_MD_CTX_free = self._lib.EVP_MD_CTX_free
-            self.EVP_MD_CTX_free.restype = None
-            self.EVP_MD_CTX_free.argtypes = [ctypes.c_void_p]
-        else:
-            self.EVP_MD_CTX_create = self._lib.EVP_MD_CTX_create
-            self.EVP_MD_CTX_create.restype = ctypes.c_void_p
-            self.EVP_MD_CTX_create.argtypes = []
-
-            self.EVP_MD_CTX_init = self._lib.EVP_MD_CTX_init
-            self.EVP_MD_CTX_init.restype = None
-            self.EVP_MD_CTX_init.argtypes = [ctypes.c_void_p]
-
-            self.EVP_MD_CTX_destroy = self._lib.EVP_MD_CTX_destroy
-            self.EVP_MD_CTX_destroy.restype = None
-            self.EVP_MD_CTX_destroy.argtypes = [ctypes.c_void_p]
-
-        self.RAND_bytes = self._lib.RAND_bytes
-        self.RAND_bytes.restype = ctypes.c_int
-        self.RAND_bytes.argtypes = [ctypes.c_void_p, ctypes.c_int]
-
-        self.EVP_sha256 = self._lib.EVP_sha256
-        self.EVP_sha256.restype = ctypes.c_void_p
-        self.EVP_sha256.argtypes = []
-
-        self.i2o_ECPublicKey = self._lib.i2o_ECPublicKey
-        self.i2o_ECPublicKey.restype = ctypes.c_int
-        self.i2o_ECPublicKey.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
-
-        self.EVP_sha512 = self._lib.EVP_sha512
-        self.EVP_sha512.restype = ctypes.c_void_p
-        self.EVP_sha512.argtypes = []
-
-        self.HMAC = self._lib.HMAC
-        self.HMAC.restype = ctypes.c_void_p
-        self.HMAC.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int,
-                              ctypes.c_void_p, ctypes.c_int,
-                              ctypes.c_void_p, ctypes.c_void_p]
-
-        try:
-            self.PKCS5_PBKDF2_HMAC = self._lib.PKCS5_PBKDF2_HMAC
-        except:
-            # The above is not compatible with all versions of OSX.
-            self.PKCS5_PBKDF2_HMAC = self._lib.PKCS5_PBKDF2_HMAC_SHA1
-        self.PKCS5_PBKDF2_HMAC.restype = ctypes.c_int
-        self.PKCS5_PBKDF2_HMAC.argtypes = [ctypes.c_void_p, ctypes.c_int,
-                                           ctypes.c_void_p, ctypes.c_int,
-                                           ctypes.c_int, ctypes.c_void_p,
-                                           ctypes.c_int, ctypes.c_void_p]
-
-        self._set_ciphers()
-        self._set_curves()
+            if name in _FALLBACKS:
+                func = getattr(self._lib, _FALLBACKS[name])
+            elif name in _OPTIONAL:
+                func = None
+            else:
+                raise
+        if func is not None:
+            func.restype, func.argtypes = _FUNCTIONS[name]
+        setattr(self, name, func)
+        return func
 
     def _set_ciphers(self):
         self.cipher_algo = {
@@ -507,10 +324,10 @@ class _OpenSSL:
                                       self.EVP_aes_256_cfb128,
                                       16),
             'aes-128-ofb': CipherName('aes-128-ofb',
-                                      self._lib.EVP_aes_128_ofb,
+                                      self.EVP_aes_128_ofb,
                                       16),
             'aes-256-ofb': CipherName('aes-256-ofb',
-                                      self._lib.EVP_aes_256_ofb,
+                                      self.EVP_aes_256_ofb,
                                       16),
             'bf-cfb': CipherName('bf-cfb',
                                  self.EVP_bf_cfb64,
@@ -527,16 +344,39 @@ class _OpenSSL:
         if hasattr(self, 'EVP_aes_128_ctr'):
             self.cipher_algo['aes-128-ctr'] = CipherName(
                 'aes-128-ctr',
-                self._lib.EVP_aes_128_ctr,
+                self.EVP_aes_128_ctr,
                 16
             )
         if hasattr(self, 'EVP_aes_256_ctr'):
             self.cipher_algo['aes-256-ctr'] = CipherName(
                 'aes-256-ctr',
-                self._lib.EVP_aes_256_ctr,
+                self.EVP_aes_256_ctr,
                 16
             )
 
+        # AEAD: the size here is the IV (nonce) length, tags are 16 bytes
+        if hasattr(self, 'EVP_aes_128_gcm'):
+            self.cipher_algo['aes-128-gcm'] = CipherName(
+                'aes-128-gcm',
+                self.EVP_aes_128_gcm,
+                12,
+                aead=True
+            )
+        if hasattr(self, 'EVP_aes_256_gcm'):
+            self.cipher_algo['aes-256-gcm'] = CipherName(
+                'aes-256-gcm',
+                self.EVP_aes_256_gcm,
+                12,
+                aead=True
+            )
+        if hasattr(self, 'EVP_chacha20_poly1305'):
+            self.cipher_algo['chacha20-poly1305'] = CipherName(
+                'chacha20-poly1305',
+                self.EVP_chacha20_poly1305,
+                12,
+                aead=True
+            )
+
     def _set_curves(self):
         self.curves = {
             'secp112r1': 704,
@@ -630,8 +470,42 @@ class _OpenSSL:
             buffer = self.create_string_buffer(size)
         return buffer
 
+    def buffer(self, data):
+        """
+        returns (argument, size) to pass data to libcrypto without a copy:
+        bytes as they are, writable buffers (bytearray, memoryview, mmap)
+        through ctypes from_buffer. str is encoded and other read-only
+        views are copied once
+        """
+        if isinstance(data, bytes):
+            return data, len(data)
+        if isinstance(data, str):
+            data = data.encode()
+            return data, len(data)
+        view = memoryview(data)
+        if isinstance(view.obj, bytes) and view.nbytes == len(view.obj):
+            return view.obj, view.nbytes
+        if view.readonly or not view.c_contiguous:
+            data = view.tobytes()
+            return data, len(data)
+        view = view.cast('B')
+        return (ctypes.c_char * view.nbytes).from_buffer(view), view.nbytes
+
+    def output_buffer(self, out, size):
+        """
+        returns a ctypes array over the first size bytes of the writable
+        buffer out, for libcrypto to write into
+        """
+        view = memoryview(out)
+        if view.readonly:
+            raise TypeError("output buffer is read-only")
+        view = view.cast('B')
+        if view.nbytes < size:
+            raise ValueError("output buffer is %d bytes, %d needed" % (view.nbytes, size))
+        return (ctypes.c_char * size).from_buffer(view)
+
     def get_error(self):
-        return OpenSSL.ERR_error_string(OpenSSL.ERR_get_error(), None)
+        return OpenSSL.ERR_error_string(OpenSSL.ERR_get_error(), None).decode('ascii', 'replace')
 
 
 libname = find_crypto_lib()
@@ -1,3 +1,4 @@
+import io
 import unittest
 from binascii import unhexlify, hexlify
 
@@ -56,3 +57,72 @@ class TestCipher(unittest.TestCase):
 
         ctx = Cipher(key, iv, 0, ciphername=ciphername)
         self.assertEqual(plaintext, ctx.ciphering(enc))
+
+
+class TestCipherReuse(unittest.TestCase):
+
+    def test_reset(self):
+        key, key2, iv, iv2 = b"k" * 32, b"K" * 32, b"i" * 16, b"I" * 16
+        ctx = Cipher(key, iv, 1, 'aes-256-cbc')
+        self.assertEqual(ctx.ciphering(b"first"), Cipher(key, iv, 1, 'aes-256-cbc').ciphering(b"first"))
+        ctx.reset(None, iv2)
+        self.assertEqual(ctx.ciphering(b"second"), Cipher(key, iv2, 1, 'aes-256-cbc').ciphering(b"second"))
+        ctx.reset(key2, iv)
+        self.assertEqual(ctx.ciphering(b"third"), Cipher(key2, iv, 1, 'aes-256-cbc').ciphering(b"third"))
+
+    def test_update_into(self):
+        key, iv = b"k" * 32, b"i" * 16
+        data = b"x" * 100
+        out = bytearray(len(data) + 16)
+        ctx = Cipher(key, iv, 1, 'aes-256-cbc')
+        n = ctx.update_into(data, out)
+        n += ctx.final_into(memoryview(out)[n:])
+        self.assertEqual(bytes(out[:n]), Cipher(key, iv, 1, 'aes-256-cbc').ciphering(data))
+        ctx = Cipher(key, iv, 1, 'aes-256-ctr')
+        self.assertEqual(ctx.block_size, 1)
+        out = bytearray(len(data))
+        self.assertEqual(ctx.update_into(data, out), len(data))
+        self.assertEqual(bytes(out), Cipher(key, iv, 1, 'aes-256-ctr').update(data))
+        self.assertRaises(ValueError, ctx.update_into, data, bytearray(10))
+
+
+class TestCipherStream(unittest.TestCase):
+
+    def test_stream(self):
+        key, iv = b"k" * 32, b"i" * 16
+        for size in (0, 15, 16, 17, 10000):
+            data = bytes(bytearray(range(256))) * (size // 256) + b"x" * (size % 256)
+            encrypted = io.BytesIO()
+            written = Cipher.encrypt_stream(io.BytesIO(data), encrypted, key, iv, chunk_size=1000)
+            self.assertEqual(encrypted.getvalue(), Cipher(key, iv, 1).ciphering(data))
+            self.assertEqual(written, len(encrypted.getvalue()))
+            decrypted = io.BytesIO()
+            Cipher.decrypt_stream(io.BytesIO(encrypted.getvalue()), decrypted, key, iv, chunk_size=64)
+            self.assertEqual(decrypted.getvalue(), data)
+
+
+class TestAEAD(unittest.TestCase):
+
+    def test_gcm_vector(self):
+        # NIST GCM test case 2: zero key, IV and plaintext block
+        ctx = Cipher(b"\0" * 16, b"\0" * 12, 1, 'aes-128-gcm')
+        ciphertext = ctx.ciphering(b"\0" * 16)
+        self.assertEqual(hexlify(ciphertext), b"0388dace60b6a392f328c2b971b2fe78")
+        self.assertEqual(hexlify(ctx.get_tag()), b"ab6e47d42cec13bdf53a67b21257bddf")
+
+    def test_tag(self):
+        key, iv = b"k" * 32, b"i" * 12
+        for ciphername in ('aes-256-gcm', 'chacha20-poly1305'):
+            ctx = Cipher(key, iv, 1, ciphername)
+            ctx.update_aad(b"header")
+            ciphertext = ctx.ciphering(b"message")
+            tag = ctx.get_tag()
+            ctx = Cipher(key, iv, 0, ciphername)
+            ctx.update_aad(b"header")
+            ctx.set_tag(tag)
+            self.assertEqual(ctx.ciphering(ciphertext), b"message")
+            ctx = Cipher(key, iv, 0, ciphername)
+            ctx.update_aad(b"Header")
+            ctx.set_tag(tag)
+            ctx.update(ciphertext)
+            self.assertRaises(Exception, ctx.final)
@@ -1,7 +1,9 @@
+import hashlib
 import unittest
+from array import array
 from binascii import hexlify
 
-from pyelliptic import ECC
+from pyelliptic import ECC, OpenSSL
 
 
 class TestECDSA(unittest.TestCase):
@@ -23,3 +25,89 @@ class TestECDSA(unittest.TestCase):
         res = ECC(pubkey_x=alice.pubkey_x,
                   pubkey_y=alice.pubkey_y).verify(sig, plaintext)
         self.assertFalse(res)
+
+
+class TestVerifyMany(unittest.TestCase):
+
+    def test_verify_many(self):
+        alice = ECC(curve='secp256k1')
+        messages = [b"record %d" % i for i in range(8)] + [b""]
+        signatures = [(alice.sign(message), message) for message in messages]
+        bob = ECC(pubkey=alice.get_pubkey(), curve='secp256k1')
+        self.assertEqual(bob.verify_many(signatures), [True] * len(messages))
+        signatures[2] = (signatures[2][0], b"forged")
+        signatures[5] = (b"\x30\x00", signatures[5][1])
+        expected = [True] * len(messages)
+        expected[2] = expected[5] = False
+        self.assertEqual(bob.verify_many(signatures), expected)
+        self.assertEqual(bob.verify_many([]), [])
+
+    def test_verifier(self):
+        alice = ECC(curve='secp256k1')
+        with alice.verifier() as verifier:
+            self.assertTrue(verifier.verify(alice.sign(b"test"), b"test"))
+            self.assertFalse(verifier.verify(alice.sign(b"test"), b"tset"))
+        self.assertRaises(Exception, verifier.verify, alice.sign(b"test"), b"test")
+
+    def test_str_and_typed_buffers(self):
+        alice = ECC(curve='secp256k1')
+        bob = ECC(pubkey=alice.get_pubkey(), curve='secp256k1')
+        self.assertTrue(bob.verify(alice.sign(b"Hello Alice"), "Hello Alice"))
+        words = array('I', [1, 2, 3, 4])
+        sig = alice.sign(words.tobytes())
+        self.assertTrue(bob.verify(sig, words))
+        self.assertTrue(bob.verify(sig, memoryview(words)))
+
+    def test_verifier_digest_failure(self):
+        alice = ECC(curve='secp256k1')
+        sig = alice.sign(b"test")
+        verifier = alice.verifier()
+        self.addCleanup(verifier.close)
+        self.addCleanup(setattr, OpenSSL, 'EVP_DigestFinal_ex', OpenSSL.EVP_DigestFinal_ex)
+        OpenSSL.EVP_DigestFinal_ex = lambda *args: 0
+        self.assertRaises(Exception, verifier.verify, sig, b"test")
+
+    def test_verifier_outlives_key(self):
+        alice = ECC(curve='secp256k1')
+        sig = alice.sign(b"test")
+        verifier = alice.verifier()
+        alice.close()
+        self.assertTrue(verifier.verify(sig, b"test"))
+        alice.privkey = ECC(curve='secp256k1').privkey
+        self.assertTrue(verifier.verify(sig, b"test"))
+        verifier.close()
+
+
+class TestSignDigest(unittest.TestCase):
+
+    def test_sign_digest(self):
+        alice = ECC(curve='secp256k1')
+        digest = hashlib.sha256(b"large file").digest()
+        sig = alice.sign_digest(digest, check=False)
+        self.assertTrue(alice.verify_digest(sig, digest))
+        self.assertTrue(alice.verify(sig, b"large file"))
+        self.assertTrue(alice.verify_digest(alice.sign(b"large file"), digest))
+        self.assertFalse(alice.verify_digest(sig, hashlib.sha256(b"other").digest()))
+        with alice.verifier() as verifier:
+            self.assertTrue(verifier.verify_digest(sig, digest))
+
+    def test_signer(self):
+        alice = ECC(curve='secp256k1')
+        signer = alice.signer(b"large")
+        signer.update(memoryview(b" file"))
+        signer.update(bytearray())
+        self.assertEqual(signer.digest(), hashlib.sha256(b"large file").digest())
+        sig = signer.sign(check=False)
+        self.assertTrue(signer.verify(sig))
+        self.assertTrue(alice.verify(sig, b"large file"))
+        signer.update(b"!")
+        self.assertFalse(signer.verify(sig))
+
+    def test_str_input(self):
+        alice = ECC(curve='secp256k1')
+        sig = alice.sign("Hello Alice")
+        self.assertTrue(alice.verify(sig, b"Hello Alice"))
+        self.assertTrue(alice.verify(sig, "Hello Alice"))
+        signer = alice.signer("Hello ")
+        signer.update("Alice")
+        self.assertTrue(alice.verify(signer.sign(), "Hello Alice"))
@@ -1,7 +1,10 @@
+import io
 import unittest
+from struct import pack
 from binascii import hexlify
 
 from pyelliptic import ECC
+from pyelliptic.ecc import MAX_SEGMENT_SIZE
 
 
 class TestCIES(unittest.TestCase):
@@ -20,3 +23,68 @@ class TestCIES(unittest.TestCase):
                                  ciphername="rc4")
         print(hexlify(ciphertext))
         self.assertEqual(plaintext, alice.decrypt(ciphertext, ciphername="rc4"))
+
+
+class TestAEADECIES(unittest.TestCase):
+
+    def test_aead(self):
+        alice = ECC(curve='secp256k1')
+        bob = ECC(curve='secp256k1')
+        for ciphername in ('aes-256-gcm', 'chacha20-poly1305'):
+            ciphertext = alice.encrypt(b"hello bob", bob.get_pubkey(), ciphername=ciphername)
+            self.assertEqual(bob.decrypt(ciphertext, ciphername=ciphername), b"hello bob")
+            for pos in (0, 20, len(ciphertext) - 1):
+                tampered = bytearray(ciphertext)
+                tampered[pos] ^= 1
+                self.assertRaises(Exception, bob.decrypt, bytes(tampered), ciphername=ciphername)
+
+
+class TestStreamECIES(unittest.TestCase):
+
+    def test_round_trip(self):
+        alice = ECC(curve='secp256k1')
+        bob = ECC(curve='secp256k1')
+        for size in (0, 1, 100, 250):
+            data = b"x" * size
+            encrypted = io.BytesIO()
+            written = alice.encrypt_stream(io.BytesIO(data), encrypted, bob.get_pubkey(), segment_size=100)
+            self.assertEqual(written, len(encrypted.getvalue()))
+            decrypted = io.BytesIO()
+            self.assertEqual(bob.decrypt_stream(io.BytesIO(encrypted.getvalue()), decrypted), size)
+            self.assertEqual(decrypted.getvalue(), data)
+
+    def test_tampering(self):
+        alice = ECC(curve='secp256k1')
+        bob = ECC(curve='secp256k1')
+        encrypted = io.BytesIO()
+        alice.encrypt_stream(io.BytesIO(b"x" * 250), encrypted, bob.get_pubkey(), segment_size=100)
+        encrypted = encrypted.getvalue()
+        header, segment = 65 + 4, 100 + 16
+        first, second = encrypted[header:header + segment], encrypted[header + segment:header + 2 * segment]
+        bad = [encrypted[:header + 2 * segment],  # truncated at a segment boundary
+               encrypted[:header] + second + first + encrypted[header + 2 * segment:],
+               encrypted[:-1]]
+        for pos in (10, header + 5, len(encrypted) - 1):
+            tampered = bytearray(encrypted)
+            tampered[pos] ^= 1
+            bad.append(bytes(tampered))
+        for data in bad:
+            self.assertRaises(Exception, bob.decrypt_stream, io.BytesIO(data), io.BytesIO())
+
+    def test_needs_aead(self):
+        alice = ECC(curve='secp256k1')
+        self.assertRaises(Exception, alice.encrypt_stream, io.BytesIO(b"x"), io.BytesIO(),
+                          alice.get_pubkey(), ciphername='aes-256-cbc')
+
+    def test_segment_size_limit(self):
+        alice = ECC(curve='secp256k1')
+        bob = ECC(curve='secp256k1')
+        encrypted = io.BytesIO()
+        alice.encrypt_stream(io.BytesIO(b"x" * 250), encrypted, bob.get_pubkey(), segment_size=100)
+        encrypted = encrypted.getvalue()
+        self.assertRaises(RuntimeError, bob.decrypt_stream, io.BytesIO(encrypted), io.BytesIO(),
+                          max_segment_size=99)
+        hostile = encrypted[:65] + pack('!I', 0xFFFFFFFF) + encrypted[69:]
+        self.assertRaises(RuntimeError, bob.decrypt_stream, io.BytesIO(hostile), io.BytesIO())
+        self.assertRaises(Exception, alice.encrypt_stream, io.BytesIO(b"x"), io.BytesIO(),
+                          bob.get_pubkey(), segment_size=MAX_SEGMENT_SIZE + 1)
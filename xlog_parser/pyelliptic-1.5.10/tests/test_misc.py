@@ -31,8 +31,11 @@
 
 
 import unittest
+from binascii import hexlify
 
 from pyelliptic import ECC
+from pyelliptic import Cipher
+from pyelliptic import OpenSSL
 from pyelliptic import hash as _hash
 
 
@@ -64,3 +67,129 @@ class TestCompatibilities(unittest.TestCase):
         alice2 = ECC(curve=curve, pubkey_x=px, pubkey_y=py, raw_privkey=pv)
         self.assertEqual(alice2.get_pubkey(), alice.get_pubkey())
         self.assertEqual(alice2.get_privkey(), alice.get_privkey())
+
+
+class TestNativeKey(unittest.TestCase):
+
+    def test_reuse_after_close(self):
+        alice = ECC(curve='secp256k1')
+        bob = ECC(curve='secp256k1')
+        key = alice.get_ecdh_key(bob.get_pubkey())
+        alice.close()
+        self.assertEqual(alice.get_ecdh_key(bob.get_pubkey()), key)
+        self.assertEqual(bob.get_ecdh_key(alice.get_pubkey()), key)
+
+    def test_assign_privkey(self):
+        alice = ECC(curve='secp256k1')
+        bob = ECC(curve='secp256k1')
+        carol = ECC(curve='secp256k1')
+        carol.get_ecdh_key(bob.get_pubkey())
+        carol.privkey = alice.privkey
+        self.assertEqual(carol.get_ecdh_key(bob.get_pubkey()),
+                         bob.get_ecdh_key(alice.get_pubkey()))
+
+    def test_context_manager(self):
+        with ECC() as alice:
+            sig = alice.sign(b"message")
+            self.assertTrue(alice.verify(sig, b"message"))
+        self.assertIsNone(alice._key)
+
+    def test_bad_peer_key(self):
+        alice = ECC(curve='secp256k1')
+        bob = ECC(curve='secp256k1')
+        pubkey_y = bob.pubkey_y[:-1] + bytes(bytearray([bob.pubkey_y[-1] ^ 1]))
+        self.assertRaises(Exception, alice.raw_get_ecdh_key, bob.pubkey_x, pubkey_y)
+
+
+class TestBatchECDH(unittest.TestCase):
+
+    def test_ecdh_keys(self):
+        alice = ECC(curve='secp256k1')
+        peers = [ECC(curve='secp256k1') for i in range(5)]
+        pubkeys = [peer.get_pubkey() for peer in peers]
+        expected = [peer.get_ecdh_key(alice.get_pubkey()) for peer in peers]
+        self.assertEqual(alice.get_ecdh_keys(pubkeys), expected)
+        self.assertEqual(alice.get_ecdh_keys(pubkeys, threads=3), expected)
+        self.assertEqual(alice.get_ecdh_keys([]), [])
+
+    def test_bad_peer_in_batch(self):
+        alice = ECC(curve='secp256k1')
+        bob = ECC(curve='secp256k1')
+        pubkey_y = bob.pubkey_y[:-1] + bytes(bytearray([bob.pubkey_y[-1] ^ 1]))
+        self.assertRaises(Exception, alice.raw_get_ecdh_keys,
+                          [(bob.pubkey_x, bob.pubkey_y), (bob.pubkey_x, pubkey_y)])
+
+
+class TestIncrementalHMAC(unittest.TestCase):
+
+    def test_backends(self):
+        # RFC 4231 test case 2
+        expected = "5bdcc146bf60754e6a042426089575c75a003f089d2739839dec58b964ec3843"
+        self.assertEqual(hexlify(_hash.hmac_sha256(b"Jefe", b"what do ya want for nothing?")),
+                         expected.encode())
+        for backend in ('hashlib', 'openssl'):
+            mac = _hash.new(b"Jefe", b"what do ya ", backend=backend)
+            mac.update(memoryview(b"want for nothing?"))
+            self.assertEqual(mac.hexdigest(), expected)
+            self.assertEqual(mac.digest(), mac.digest())
+            mac = _hash.new(b"key", digestmod='sha512', backend=backend)
+            mac.update(b"message")
+            self.assertEqual(mac.digest(), _hash.hmac_sha512(b"key", b"message"))
+
+    def test_copy(self):
+        for backend in ('hashlib', 'openssl'):
+            template = _hash.new(b"key", backend=backend)
+            first = template.copy()
+            first.update(b"first")
+            second = template.copy()
+            second.update(b"second")
+            self.assertEqual(first.digest(), _hash.hmac_sha256(b"key", b"first"))
+            self.assertEqual(second.digest(), _hash.hmac_sha256(b"key", b"second"))
+            self.assertEqual(template.digest(), _hash.hmac_sha256(b"key", b""))
+
+    def test_unsupported(self):
+        self.assertRaises(Exception, _hash.new, b"key", backend='nss')
+        self.assertRaises(Exception, _hash.new, b"key", digestmod='md5', backend='openssl')
+
+
+class TestOpenSSL(unittest.TestCase):
+
+    def test_lazy_binding(self):
+        func = OpenSSL.BN_num_bits
+        self.assertIs(OpenSSL.BN_num_bits, func)
+        self.assertEqual(func.restype, OpenSSL.c_int)
+
+    def test_unknown_function(self):
+        self.assertFalse(hasattr(OpenSSL, 'EVP_no_such_cipher'))
+        self.assertRaises(AttributeError, getattr, OpenSSL, '_no_such_attribute')
+
+    def test_buffer(self):
+        data = b"payload"
+        self.assertIs(OpenSSL.buffer(data)[0], data)
+        self.assertEqual(OpenSSL.buffer(u"payload"), (data, 7))
+        shared = bytearray(data)
+        pointer, size = OpenSSL.buffer(memoryview(shared)[1:])
+        self.assertEqual((pointer.raw, size), (data[1:], 6))
+        shared[1] = ord("A")
+        self.assertEqual(pointer.raw, b"Ayload")  # a view, not a copy
+        self.assertEqual(OpenSSL.buffer(memoryview(data)[2:]), (data[2:], 5))
+
+    def test_output_buffer(self):
+        out = bytearray(8)
+        OpenSSL.memmove(OpenSSL.output_buffer(out, 4), b"abcd", 4)
+        self.assertEqual(out, b"abcd\0\0\0\0")
+        self.assertRaises(ValueError, OpenSSL.output_buffer, out, 9)
+        self.assertRaises(TypeError, OpenSSL.output_buffer, b"readonly", 4)
+
+    def test_buffer_inputs(self):
+        key, iv = b"k" * 32, b"i" * 16
+        data = bytes(bytearray(range(256))) * 4
+        expected = Cipher(key, iv, 1, 'aes-256-ctr').update(data)
+        mac = _hash.hmac_sha256(key, data)
+        for buf in (bytearray(data), memoryview(data), memoryview(b"xx" + data)[2:]):
+            self.assertEqual(Cipher(key, iv, 1, 'aes-256-ctr').update(buf), expected)
+            self.assertEqual(_hash.hmac_sha256(key, buf), mac)
+
+    def test_tables(self):
+        self.assertIn('aes-256-cbc', OpenSSL.cipher_algo)
+        self.assertEqual(OpenSSL.get_curve('secp256k1'), 714)
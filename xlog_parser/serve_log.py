@@ -0,0 +1,398 @@
+import asyncio
+import collections
+import concurrent.futures
+import multiprocessing
+import multiprocessing.shared_memory
+import os
+import sys
+
+import decode_log
+
+# blocks are handed to the worker pool in segments of about this size
+SEGMENT_SIZE = 1024 * 1024
+# a header claiming a longer block than this is treated as garbage when streaming
+MAX_BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def HeaderLength(_magic):
+    blocktype = decode_log.BLOCK_TYPES[_magic]
+    return 0 if blocktype is None else decode_log.HEADER.size + blocktype.crypt_key_len
+
+
+def StreamBlockEnd(_buffer, _offset, _max_block_size, _eof):
+    """
+    End of the good block at _offset of a buffer that is still being
+    received: 0 if there is none, None if the bytes that would tell have
+    not arrived yet.
+    """
+    headerLen = HeaderLength(_buffer[_offset])
+    if 0 == headerLen: return 0
+    if _offset + headerLen > len(_buffer): return 0 if _eof else None
+    length = decode_log.HEADER.unpack_from(_buffer, _offset)[4]
+    if length > _max_block_size: return 0
+    end = _offset + headerLen + length + 1
+    if end > len(_buffer): return 0 if _eof else None
+    if decode_log.MAGIC_END != _buffer[end - 1]: return 0
+    return end
+
+
+def SplitSegments(_buffer):
+    """
+    Cut _buffer into (start, end, lastseq) segments at good block
+    boundaries, walking headers only. Decoding the segments one after
+    another with decode_log.lastseq seeded from lastseq gives the same
+    output as decoding the whole buffer, except that the positions quoted
+    in corruption markers are relative to the segment.
+    """
+    segments = []
+    offset = decode_log.GetLogStartPos(_buffer, 2)
+    if -1 == offset: return segments
+
+    segstart = offset
+    segseq = 0
+    lastseq = 0
+    while offset < len(_buffer):
+        if not decode_log.IsGoodLogBuffer(_buffer, offset, 1)[0]:
+            fixpos = decode_log.GetLogStartPos(_buffer, 1, offset)
+            if -1 == fixpos: break
+            offset = fixpos
+
+        magic_start, seq, begin_hour, end_hour, length = decode_log.HEADER.unpack_from(_buffer, offset)
+        offset += HeaderLength(magic_start) + length + 1
+        if seq != 0:
+            lastseq = seq
+
+        if offset - segstart >= SEGMENT_SIZE:
+            segments.append((segstart, offset, segseq))
+            segstart = offset
+            segseq = lastseq
+
+    if offset > segstart:
+        segments.append((segstart, offset, segseq))
+    return segments
+
+
+def DecodeSegment(_segment, _lastseq):
+    # the seq is tracked per call rather than in decode_log.lastseq, so segments
+    # can be decoded in threads side by side
+    seqstate = [_lastseq]
+    outbuffer = bytearray()
+    startpos = 0
+    while -1 != startpos:
+        startpos = decode_log.DecodeBuffer(_segment, startpos, outbuffer, None, seqstate)
+    return bytes(outbuffer)
+
+
+def DecodeSegmentShared(_file, _start, _end, _lastseq):
+    """
+    Worker side of DecodeFileShared: map _file, decode _buffer[_start:_end]
+    and leave the text in a new shared memory segment. Returns (segment
+    name, length), or (None, text) on Windows, where a segment is gone as
+    soon as its creator closes it.
+    """
+    _buffer = decode_log.MapFile(_file)
+    try:
+        output = DecodeSegment(_buffer[_start:_end], _lastseq)
+    finally:
+        _buffer.close()
+    if sys.platform == 'win32': return None, output
+
+    shm = multiprocessing.shared_memory.SharedMemory(create=True, size=max(len(output), 1))
+    shm.buf[:len(output)] = output
+    shm.close()
+    return shm.name, len(output)
+
+
+class SharedOutput:
+    """
+    Decoded text of one segment as a memoryview (view) over the shared
+    memory segment the worker wrote it to. close() releases and unlinks
+    the segment, so the view must not be used after that.
+    """
+
+    def __init__(self, name, data):
+        if name is None:
+            self.shm = None
+            self.view = memoryview(data)
+        else:
+            self.shm = multiprocessing.shared_memory.SharedMemory(name)
+            self.view = self.shm.buf[:data]
+
+    def close(self):
+        if self.view is None: return
+        self.view.release()
+        self.view = None
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def DecodeFileShared(_file, executor, inflight=4):
+    """
+    Decode _file in executor (a process pool) segment by segment and yield
+    a SharedOutput per segment, in order:
+
+        for output in DecodeFileShared(path, pool):
+            with output:
+                index(output.view)
+
+    Workers map the file themselves and hand their text back through
+    shared memory, so neither the input nor the output is pickled. At
+    most inflight segments are decoded ahead of the caller; the caller
+    closes every output it is given, the rest are closed here.
+    """
+    _buffer = decode_log.MapFile(_file)
+    if _buffer is None: return
+    try:
+        segments = SplitSegments(_buffer)
+    finally:
+        _buffer.close()
+
+    pending = collections.deque()
+    try:
+        for start, end, lastseq in segments:
+            pending.append(executor.submit(DecodeSegmentShared, _file, start, end, lastseq))
+            if len(pending) >= inflight:
+                yield SharedOutput(*pending.popleft().result())
+        while pending:
+            yield SharedOutput(*pending.popleft().result())
+    finally:
+        for future in pending:
+            if not future.cancel() and not future.exception():
+                SharedOutput(*future.result()).close()
+
+
+async def decode_stream(reader, executor=None, read_size=64 * 1024, segment_size=SEGMENT_SIZE,
+                        max_block_size=MAX_BLOCK_SIZE, inflight=4):
+    """
+    Decode xlog bytes from an asyncio StreamReader-like source (anything
+    with ``await reader.read(n)`` returning b"" at EOF) as they arrive:
+
+        async for chunk in decode_stream(request.content):
+            ...
+
+    Block boundaries are found from the headers while receiving. Once a
+    run of complete blocks reaches segment_size it is decoded in executor
+    (the loop's default executor if None), with up to inflight segments
+    in progress, and the text is yielded in order. Only the unfinished
+    tail and the segments in flight are kept in memory.
+    """
+    loop = asyncio.get_running_loop()
+    pending = bytearray()
+    futures = collections.deque()
+    started = False
+    scanned = 0  # everything before this has been classified
+    goodend = 0  # end of the last complete good block
+    lastseq = 0  # last non-zero seq before pending[0]
+    segseq = 0  # last non-zero seq up to goodend
+    eof = False
+    try:
+        while not eof:
+            data = await reader.read(read_size)
+            if data:
+                pending.extend(data)
+            else:
+                eof = True
+
+            while scanned < len(pending):
+                end = StreamBlockEnd(pending, scanned, max_block_size, eof)
+                if end is None: break
+                if 0 == end:
+                    scanned += 1
+                    continue
+
+                if not started:
+                    # like GetLogStartPos(_buffer, 2), a block only starts the log if another good
+                    # one follows it or the stream ends right after it; whatever precedes it is
+                    # dropped silently
+                    if end < len(pending):
+                        nextend = StreamBlockEnd(pending, end, max_block_size, eof)
+                    else:
+                        nextend = end if eof else None
+                    if nextend is None: break
+                    if 0 == nextend:
+                        scanned += 1
+                        continue
+                    del pending[:scanned]
+                    end -= scanned
+                    scanned = 0
+                    started = True
+                seq = decode_log.HEADER.unpack_from(pending, scanned)[1]
+                scanned = goodend = end
+                if seq != 0: segseq = seq
+
+            # cut at the last good block once there is enough; a long garbage run is handed over
+            # as it is so that a stream without block boundaries does not pile up in memory
+            if eof:
+                cut = len(pending)
+            elif goodend >= segment_size:
+                cut = goodend
+            elif scanned - goodend > max_block_size:
+                cut = scanned
+            else:
+                cut = 0
+            if not started:
+                del pending[:scanned]
+                scanned = 0
+            elif cut:
+                futures.append(loop.run_in_executor(executor, DecodeSegment, bytes(pending[:cut]), lastseq))
+                del pending[:cut]
+                scanned -= cut
+                goodend = max(0, goodend - cut)
+                lastseq = segseq
+
+            while futures and (futures[0].done() or len(futures) >= inflight or eof):
+                yield await futures.popleft()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+class DecodeServer:
+    """
+    Long-running decoder: xlog bytes come in on a Unix socket (the client
+    shuts down its write side when done) or as the body of an HTTP POST,
+    segments are decoded in a process pool and the text is streamed back
+    in order as soon as each segment is ready. Unix requests are decoded
+    while they are still being received; max_size only limits HTTP bodies.
+    """
+
+    def __init__(self, workers=None, concurrency=16, timeout=300, max_size=256 * 1024 * 1024, inflight=None):
+        # workers are spawned rather than forked: forking from the event loop
+        # once the pool's own threads are running can deadlock the children
+        self.pool = concurrent.futures.ProcessPoolExecutor(workers, multiprocessing.get_context('spawn'))
+        self.workers = workers or os.cpu_count() or 1
+        self.inflight = inflight or self.workers * 2
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.timeout = timeout
+        self.max_size = max_size
+
+    async def decode(self, _buffer):
+        loop = asyncio.get_running_loop()
+        pending = collections.deque()
+        try:
+            for start, end, lastseq in SplitSegments(_buffer):
+                pending.append(loop.run_in_executor(self.pool, DecodeSegment, bytes(_buffer[start:end]), lastseq))
+                if len(pending) >= self.inflight:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def handle_unix(self, reader, writer):
+        try:
+            await asyncio.wait_for(self.serve_unix(reader, writer), self.timeout)
+        except Exception as e:
+            sys.stderr.write("serve_log.py unix request failed: %r\n" % e)
+        finally:
+            writer.close()
+
+    async def serve_unix(self, reader, writer):
+        async with self.semaphore:
+            async for chunk in decode_stream(reader, self.pool, inflight=self.inflight):
+                writer.write(chunk)
+                await writer.drain()
+
+    async def handle_http(self, reader, writer):
+        started = []
+        try:
+            await asyncio.wait_for(self.serve_http(reader, writer, started), self.timeout)
+        except asyncio.TimeoutError:
+            if not started:
+                self.respond(writer, 408, "Request Timeout")
+        except Exception as e:
+            sys.stderr.write("serve_log.py http request failed: %r\n" % e)
+        finally:
+            writer.close()
+
+    async def serve_http(self, reader, writer, started):
+        request = (await reader.readline()).decode('latin-1').split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""): break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if 3 != len(request): return self.respond(writer, 400, "Bad Request")
+        if 'POST' != request[0]: return self.respond(writer, 405, "Method Not Allowed")
+        if 'content-length' not in headers: return self.respond(writer, 411, "Length Required")
+        try:
+            length = int(headers['content-length'])
+        except ValueError:
+            length = -1
+        if length < 0: return self.respond(writer, 400, "Bad Request")
+        if length > self.max_size: return self.respond(writer, 413, "Payload Too Large")
+
+        async with self.semaphore:
+            _buffer = await reader.readexactly(length)
+            started.append(True)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; charset=utf-8\r\n"
+                         b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+            async for chunk in self.decode(_buffer):
+                if chunk:
+                    writer.write(b"%X\r\n" % len(chunk) + chunk + b"\r\n")
+                    await writer.drain()
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+
+    def respond(self, writer, status, reason):
+        writer.write(("HTTP/1.1 %d %s\r\nContent-Length: 0\r\nConnection: close\r\n\r\n" % (status, reason)).encode())
+
+    def close(self):
+        self.pool.shutdown()
+
+
+async def Serve(_unix, _http, options):
+    server = DecodeServer(**options)
+    listeners = []
+    if _unix is not None:
+        if os.path.exists(_unix): os.unlink(_unix)
+        listeners.append(await asyncio.start_unix_server(server.handle_unix, _unix))
+    if _http is not None:
+        host, _, port = _http.rpartition(':')
+        listeners.append(await asyncio.start_server(server.handle_http, host or '127.0.0.1', int(port)))
+
+    try:
+        await asyncio.gather(*[listener.serve_forever() for listener in listeners])
+    finally:
+        server.close()
+
+
+def main(args):
+    unix = None
+    http = None
+    options = {}
+    for arg in args:
+        name, _, value = arg.partition('=')
+        if '--unix' == name:
+            unix = value
+        elif '--http' == name:
+            http = value
+        elif name in ('--workers', '--concurrency', '--max-size'):
+            options[name[2:].replace('-', '_')] = int(value)
+        elif '--timeout' == name:
+            options['timeout'] = float(value)
+        else:
+            sys.stderr.write("unknown option %s\n" % arg)
+            return 1
+
+    if unix is None and http is None:
+        sys.stderr.write("usage: serve_log.py [--unix=PATH] [--http=HOST:PORT] [--workers=N] [--concurrency=N] "
+                         "[--timeout=SECONDS] [--max-size=BYTES]\n")
+        return 1
+
+    asyncio.run(Serve(unix, http, options))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,142 @@
+import contextlib
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import decode_log
+import gen_log
+
+
+class DecoderModeTest(unittest.TestCase):
+    """
+    Runs decode_log.main on files made by gen_log: two clean files whose
+    text is known and one with skipped seqs and damaged blocks.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        decode_log.PRIV_KEY = gen_log.TEST_PRIV_KEY
+        cls.dir = tempfile.mkdtemp()
+        cls.summary = {}
+        for name, seed, options in [('clean', 1, {}), ('second', 2, {}),
+                                    ('corrupt', 3, {'gap_rate': 0.1, 'corrupt_rate': 0.2})]:
+            cls.summary[name] = gen_log.GenerateFile(cls.path(name + '.xlog'), 48 * 1024, lines=8, seed=seed,
+                                                     plainfile=cls.path(name + '.txt'), **options)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    @classmethod
+    def path(cls, name):
+        return os.path.join(cls.dir, name)
+
+    def read(self, name):
+        with open(self.path(name), 'rb') as fp:
+            return fp.read()
+
+    def run_main(self, *args):
+        """decode_log.main(args); returns (stdout bytes, stderr text)."""
+        stdout = io.TextIOWrapper(io.BytesIO(), encoding='utf-8', write_through=True)
+        stderr = io.StringIO()
+        decode_log.lastseq = 0
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            decode_log.main(list(args))
+        return stdout.buffer.getvalue(), stderr.getvalue()
+
+    def json_lines(self, *args):
+        return [json.loads(line) for line in self.run_main(*args)[0].splitlines()]
+
+    def test_decode(self):
+        self.run_main(self.path('clean.xlog'), self.path('clean.out'))
+        self.assertEqual(self.read('clean.out'), self.read('clean.txt'))
+
+        self.run_main(self.path('corrupt.xlog'), self.path('corrupt.out'))
+        out = self.read('corrupt.out')
+        self.assertIn(b"[F]decode_log_file.py decode error", out)
+        self.assertIn(b"is missing", out)
+
+    def test_verify(self):
+        clean, corrupt = self.json_lines('--verify', self.path('clean.xlog'), self.path('corrupt.xlog'))
+        self.assertEqual(clean['blocks'], self.summary['clean']['blocks'])
+        self.assertEqual((clean['corrupted'], clean['seq_gaps'], clean['resyncs']), ([], [], []))
+        self.assertTrue(corrupt['corrupted'])
+        self.assertTrue(corrupt['seq_gaps'])
+
+    def test_head_tail(self):
+        lines = self.read('clean.txt').splitlines(True)
+        for count in (1, 10, len(lines) + 5):
+            out, err = self.run_main('--head=%d' % count, self.path('clean.xlog'))
+            self.assertEqual(out, b"".join(lines[:count]))
+            out, err = self.run_main('--tail=%d' % count, self.path('clean.xlog'))
+            self.assertEqual(out, b"".join(lines[-count:]))
+
+        self.run_main('--tail=3', self.path('clean.xlog'), self.path('tail.out'))
+        self.assertEqual(self.read('tail.out'), b"".join(lines[-3:]))
+
+        for args in (['--head=5'], ['--tail=x', self.path('clean.xlog')]):
+            out, err = self.run_main(*args)
+            self.assertEqual(out, b"")
+            self.assertIn("usage:", err)
+
+    def test_split(self):
+        self.run_main('--split=tag', self.path('clean.xlog'), self.path('split.log'))
+        expected = {}
+        for line in self.read('clean.txt').splitlines(True):
+            tag = decode_log.LOG_LINE_RE.match(line).group(decode_log.LOG_LINE_FIELDS['tag']).decode()
+            expected.setdefault(tag, []).append(line)
+        self.assertIn('mars::stn', expected)
+        for tag, lines in expected.items():
+            self.assertEqual(self.read('split.%s.log' % decode_log.ShardName(tag)), b"".join(lines))
+        self.assertTrue(os.path.exists(self.path('split.mars%3A%3Astn.log')))
+
+    def test_sqlite(self):
+        self.run_main('--sqlite=' + self.path('logs.db'), self.path('clean.xlog'), self.path('second.xlog'))
+        conn = sqlite3.connect(self.path('logs.db'))
+        try:
+            counts = dict(conn.execute("SELECT file, COUNT(*) FROM log GROUP BY file"))
+        finally:
+            conn.close()
+        self.assertEqual(counts, {self.path('clean.xlog'): self.summary['clean']['lines'],
+                                  self.path('second.xlog'): self.summary['second']['lines']})
+
+    def test_index_search(self):
+        files = [self.path(name) for name in ('clean.xlog', 'second.xlog')]
+        expected = b""
+        for name, filepath in zip(('clean.txt', 'second.txt'), files):
+            expected += b"".join(filepath.encode() + b":" + line for line in self.read(name).splitlines(True)
+                                 if re.search(br"(?<!\w)port(?!\w)", line, re.I))
+        self.assertTrue(expected)
+
+        out, err = self.run_main('--search=Port', *files)
+        self.assertEqual(out, expected)
+        for filepath in files:
+            self.run_main('--index', filepath)
+            self.assertTrue(os.path.exists(filepath + ".bloom"))
+        self.assertEqual(self.read('clean.xlog.log'), self.read('clean.txt'))
+        out, err = self.run_main('--search=Port', *files)
+        self.assertEqual(out, expected)
+
+        out, err = self.run_main('--search= ', *files)
+        self.assertEqual(out, b"")
+        self.assertIn("usage:", err)
+
+    def test_index_without_blocks(self):
+        with open(self.path('junk.xlog'), 'wb') as fp:
+            fp.write(b"\xff" * 4096)
+        self.run_main('--index', self.path('junk.xlog'))
+        self.assertFalse(os.path.exists(self.path('junk.xlog.log')))
+        self.assertFalse(os.path.exists(self.path('junk.xlog.bloom')))
+
+    def test_stats(self):
+        clean, second, merged = self.json_lines('--stats', self.path('clean.xlog'), self.path('second.xlog'))
+        self.assertEqual(clean['file'], self.path('clean.xlog'))
+        self.assertEqual(clean['lines'], self.summary['clean']['lines'])
+        self.assertEqual(second['lines'], self.summary['second']['lines'])
+        self.assertEqual(merged['files'], 2)
+        self.assertEqual(merged['lines'], clean['lines'] + second['lines'])
@@ -0,0 +1,245 @@
+import collections
+import concurrent.futures
+import ctypes
+import ctypes.util
+import multiprocessing
+import os
+import select
+import struct
+import sys
+import time
+
+import decode_log
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+INOTIFY_EVENT = struct.Struct("=iIII")  # wd, mask, cookie, length of the name that follows
+
+
+def ScanDirectories(_dirs):
+    for _dir in _dirs:
+        try:
+            entries = list(os.scandir(_dir))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name.endswith(".xlog") and entry.is_file():
+                yield entry.path
+
+
+class InotifyWatcher:
+    """
+    Reports .xlog files created, written to, moved into, moved out of or
+    deleted from the watched directories, using inotify through libc.
+    """
+
+    def __init__(self, dirs):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0: raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+        for _dir in dirs:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(_dir),
+                                             IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+                                             IN_CREATE | IN_DELETE)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed", _dir)
+            self.dirs[wd] = _dir
+
+    def scan(self):
+        return list(ScanDirectories(self.dirs.values()))
+
+    def wait(self, timeout):
+        if not select.select([self.fd], [], [], timeout)[0]: return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        paths = []
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b"\0")
+            offset += INOTIFY_EVENT.size + length
+            if mask & IN_Q_OVERFLOW: return self.scan()
+            if wd in self.dirs and name.endswith(b".xlog"):
+                paths.append(os.path.join(self.dirs[wd], os.fsdecode(name)))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollWatcher:
+    """
+    Fallback for systems without inotify: rescans the directories every
+    time it is asked and reports files whose size or mtime moved, or that
+    are gone.
+    """
+
+    def __init__(self, dirs):
+        self.dirs = list(dirs)
+        self.seen = {}
+
+    def scan(self):
+        paths = list(ScanDirectories(self.dirs))
+        self.seen = dict((path, FileState(path)) for path in paths)
+        return paths
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        seen = {}
+        paths = []
+        for path in ScanDirectories(self.dirs):
+            seen[path] = FileState(path)
+            if seen[path] != self.seen.get(path): paths.append(path)
+        paths.extend(path for path in self.seen if path not in seen)
+        self.seen = seen
+        return paths
+
+    def close(self):
+        pass
+
+
+def FileState(_path):
+    try:
+        st = os.stat(_path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime)
+
+
+def IsDecoded(_path):
+    """The .log next to _path is at least as new as _path itself."""
+    try:
+        return os.path.getmtime(_path + ".log") >= os.path.getmtime(_path)
+    except OSError:
+        return False
+
+
+def DecodeFile(_path):
+    decode_log.lastseq = 0
+    return decode_log.ParseFile(_path, _path + ".log")
+
+
+def Watch(_dirs, workers=None, settle=2.0, interval=1.0, polling=False):
+    """
+    Decode every .xlog file that lands in _dirs into <file>.log. A file is
+    handed to the pool once its size and mtime have not moved for settle
+    seconds, and at most workers files are decoded at a time; the rest
+    wait their turn. Files whose .log is already up to date are skipped.
+    """
+    watcher = None
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            watcher = InotifyWatcher(_dirs)
+        except OSError as e:
+            sys.stderr.write("watch_log.py inotify unavailable (%s), polling instead\n" % e)
+    if watcher is None:
+        watcher = PollWatcher(_dirs)
+
+    workers = workers or os.cpu_count() or 1
+    pool = concurrent.futures.ProcessPoolExecutor(workers, multiprocessing.get_context('spawn'))
+    pending = {}  # path -> (size, mtime), time of the last change
+    decoded = {}  # path -> (size, mtime) it was decoded at
+    queue = collections.deque()
+    running = {}
+    busy = set()  # paths queued or being decoded
+
+    def note(path):
+        state = FileState(path)
+        if state is None:
+            # deleted or rotated away: forget it so decoded does not grow forever
+            decoded.pop(path, None)
+            return
+        if decoded.get(path) == state or path in busy: return
+        if path not in pending and IsDecoded(path):
+            decoded[path] = state
+            return
+        if path not in pending or pending[path][0] != state:
+            pending[path] = (state, time.time())
+
+    try:
+        for path in watcher.scan():
+            note(path)
+
+        while True:
+            for path in watcher.wait(interval if not pending else min(interval, settle)):
+                note(path)
+
+            now = time.time()
+            for path, (state, changed) in list(pending.items()):
+                current = FileState(path)
+                if current is None:
+                    del pending[path]
+                    decoded.pop(path, None)
+                elif current != state:
+                    pending[path] = (current, now)
+                elif now - changed >= settle:
+                    del pending[path]
+                    queue.append((path, state))
+                    busy.add(path)
+
+            while queue and len(running) < workers:
+                path, state = queue.popleft()
+                running[pool.submit(DecodeFile, path)] = (path, state)
+
+            for future in [future for future in running if future.done()]:
+                path, state = running.pop(future)
+                busy.discard(path)
+                # changes seen while the file was busy were dropped by note(), and the .log
+                # just written would make IsDecoded() vouch for them, so requeue directly
+                current = FileState(path)
+                if current is None:
+                    decoded.pop(path, None)
+                else:
+                    decoded[path] = state
+                    if current != state:
+                        pending[path] = (current, time.time())
+                try:
+                    if future.result(): sys.stdout.write("%s.log\n" % path)
+                except Exception as e:
+                    sys.stderr.write("watch_log.py decoding %s failed: %r\n" % (path, e))
+                sys.stdout.flush()
+    finally:
+        watcher.close()
+        pool.shutdown(cancel_futures=True)
+
+
+def main(args):
+    dirs = []
+    options = {}
+    for arg in args:
+        name, _, value = arg.partition('=')
+        if '--workers' == name:
+            options['workers'] = int(value)
+        elif name in ('--settle', '--interval'):
+            options[name[2:]] = float(value)
+        elif '--poll' == name:
+            options['polling'] = True
+        elif name.startswith('--'):
+            sys.stderr.write("unknown option %s\n" % arg)
+            return 1
+        else:
+            dirs.append(arg)
+
+    if not dirs:
+        sys.stderr.write("usage: watch_log.py [--workers=N] [--settle=SECONDS] [--interval=SECONDS] [--poll] dir...\n")
+        return 1
+
+    try:
+        Watch(dirs, **options)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))